@@ -0,0 +1,155 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import silence_remover
+
+
+# The per-sample loop detect_silence used before it was vectorized, kept as the reference
+def detect_silence_loop(audio_array, threshold=0.01, min_silence_duration=10):
+    silent = (np.abs(audio_array).max(axis=1) < threshold)
+    silent_ranges = []
+    silent_start = None
+
+    for i, is_silent in enumerate(silent):
+        if is_silent and silent_start is None:
+            silent_start = i
+        elif not is_silent and silent_start is not None:
+            duration = i - silent_start
+            if duration >= min_silence_duration * audio_array.shape[0] / len(silent):
+                silent_ranges.append((silent_start / audio_array.shape[0], i / audio_array.shape[0]))
+            silent_start = None
+
+    if silent_start is not None:
+        duration = len(silent) - silent_start
+        if duration >= min_silence_duration * audio_array.shape[0] / len(silent):
+            silent_ranges.append((silent_start / audio_array.shape[0], len(silent) / audio_array.shape[0]))
+
+    return silent_ranges
+
+
+# Tone with planted silences of random length, optionally starting and ending silent
+def synthetic_audio(seconds, fps, channels=2, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * fps)
+    t = np.arange(n, dtype=np.float32) / fps
+    audio = np.empty((n, channels), dtype=np.float32)
+    audio[:, 0] = 0.5 * np.sin(2 * np.pi * 440.0 * t)
+    audio[:, 1:] = audio[:, :1]
+
+    pos = 0
+    while pos < n:
+        pos += int(rng.uniform(0.5, 30.0) * fps)
+        length = int(rng.uniform(0.001, 20.0) * fps)
+        audio[pos:pos + length] *= 0.001
+        pos += length
+    return audio
+
+
+def check_regressions(detect_silence):
+    cases = [
+        np.zeros((0, 2), dtype=np.float32),
+        np.zeros((1, 2), dtype=np.float32),
+        np.ones((5, 1), dtype=np.float32),
+        np.zeros((5, 1), dtype=np.float32),
+        np.array([[0.0], [0.0], [1.0], [0.0], [1.0], [0.0], [0.0], [0.0]], dtype=np.float32),
+    ]
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        cases.append(rng.uniform(-0.03, 0.03, size=(int(rng.integers(1, 400)), 2)).astype(np.float32))
+    cases.append(synthetic_audio(120, 1000, seed=2))
+
+    for audio in cases:
+        for min_silence_duration in (0, 1, 3, 10, 250):
+            expected = detect_silence_loop(audio, 0.01, min_silence_duration)
+            actual = detect_silence(audio, 0.01, min_silence_duration)
+            assert actual == expected, (audio.shape, min_silence_duration, actual[:3], expected[:3])
+    print(f"Regression check passed on {len(cases)} inputs")
+
+
+# scan_loudness against windows cut straight from the samples, at a rate where ms values do not map
+# to whole samples, with blocks small enough that windows straddle them and with hops longer than
+# the window, whose gaps are skipped. The length leaves the last block ending between two of those
+# windows, which is where the gap handling can go wrong
+def check_window_hops(fps=22050, length=161165):
+    rng = np.random.default_rng(3)
+    samples = (rng.uniform(-0.5, 0.5, size=(length, 2)) * 32767).astype("<i2")
+    audio = samples.astype(np.float32) / 32768
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "noise.wav")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(fps)
+            f.writeframes(samples.tobytes())
+
+        cases = [(1000, None), (20, 10), (10, 30), (30, 30), (7, 100)]
+        for window_ms, hop_ms in cases:
+            window, hop = silence_remover.window_samples(fps, window_ms, hop_ms)
+            expected = np.array([np.abs(audio[start:start + window]).max() for start in range(0, len(audio), hop)])
+            for windows_per_block in (None, 16):
+                peaks, _ = silence_remover.scan_loudness(path, fps, 2, window_ms, hop_ms, windows_per_block)
+                assert len(peaks) == len(expected), (window_ms, hop_ms, len(peaks), len(expected))
+                assert np.allclose(peaks, expected), (window_ms, hop_ms)
+    print(f"Window and hop check passed on {len(cases)} window/hop pairs at {fps} Hz")
+
+
+# The cached window envelope against the per-sample peak it summarises, for minimum durations of a
+# window and longer, with quiet stretches that start and end inside windows and a short last window
+def check_window_envelope(fps=1000):
+    rng = np.random.default_rng(4)
+    window = silence_remover.ENVELOPE_WINDOW
+    cases = 0
+    for _ in range(100):
+        peak = np.abs(rng.standard_normal(int(rng.integers(1, 20000)))).astype(np.float32)
+        for _ in range(rng.integers(0, 8)):
+            start = int(rng.integers(0, len(peak)))
+            peak[start:start + int(rng.integers(0, 4000))] *= rng.choice([0.0, 0.001, 0.01])
+        envelope = silence_remover.sample_window_envelope(peak, chunk=int(rng.integers(1, 5)))
+        for threshold in (0.0001, 0.005, 0.05, 2.0):
+            for min_silence_duration in (window / fps, 1.5, 3.7):
+                expected = silence_remover.detect_silence_envelope(peak, threshold, min_silence_duration, fps=fps)
+                actual = silence_remover.detect_silence_windowed(envelope, threshold, min_silence_duration, fps=fps)
+                assert actual == expected, (len(peak), threshold, min_silence_duration, actual[:3], expected[:3])
+        cases += 1
+    print(f"Window envelope check passed on {cases} inputs")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark detect_silence in silence_remover.py.")
+    parser.add_argument("--hours", type=float, default=2.0, help="Length of the synthetic input (default: 2)")
+    parser.add_argument("--fps", type=int, default=44100, help="Sample rate of the synthetic input (default: 44100)")
+    parser.add_argument("--min_silence_duration", type=int, default=10,
+                        help="Minimum silence length passed to detect_silence (default: 10)")
+    parser.add_argument("--skip-loop", action="store_true",
+                        help="Only time the vectorized engine (the loop takes minutes on multi-hour input)")
+    args = parser.parse_args()
+
+    check_regressions(silence_remover.detect_silence)
+    check_window_hops()
+    check_window_envelope()
+
+    audio = synthetic_audio(args.hours * 3600, args.fps)
+    print(f"Synthetic input: {args.hours} h at {args.fps} Hz, {audio.shape[0]} samples")
+
+    ranges, elapsed = timed(silence_remover.detect_silence, audio, 0.01, args.min_silence_duration)
+    print(f"vectorized: {elapsed:.2f} s, {len(ranges)} ranges")
+
+    if not args.skip_loop:
+        expected, loop_elapsed = timed(detect_silence_loop, audio, 0.01, args.min_silence_duration)
+        assert ranges == expected
+        print(f"loop:       {loop_elapsed:.2f} s, {len(expected)} ranges")
+        print(f"speedup:    {loop_elapsed / elapsed:.1f}x")
@@ -0,0 +1,162 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import silence_remover
+from silence_remover import SampleDetector, SpeechDetector, WindowDetector, ffmpeg_binary
+
+FPS = 44100
+MIN_SILENCE_DURATION = 10
+
+
+# Alternating tone and silence; silences shorter than MIN_SILENCE_DURATION are planted too and
+# must not be detected
+def silence_layout(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    planted, short = [], []
+    t = float(rng.uniform(5, 30))
+    while True:
+        length = float(rng.choice([rng.uniform(1, 5), rng.uniform(MIN_SILENCE_DURATION + 2, 40)]))
+        if t + length > seconds - 5:
+            break
+        (planted if length > MIN_SILENCE_DURATION else short).append((round(t, 3), round(t + length, 3)))
+        t += length + float(rng.uniform(5, 60))
+    return planted, short
+
+
+def generate_media(path, seconds, seed=0, block_seconds=60):
+    planted, short = silence_layout(seconds, seed)
+    silences = sorted(planted + short)
+
+    # Audio is rendered block by block into ffmpeg's stdin; the video is a lavfi colour source
+    cmd = [ffmpeg_binary(), "-v", "error", "-y",
+           "-f", "s16le", "-ar", str(FPS), "-ac", "1", "-i", "pipe:0",
+           "-f", "lavfi", "-i", f"color=c=gray:s=160x120:r=5:d={seconds}",
+           "-map", "1:v", "-map", "0:a", "-c:v", "libx264", "-preset", "ultrafast", "-g", "50",
+           "-c:a", "aac", "-shortest", path]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    for block_start in range(0, int(seconds * FPS), block_seconds * FPS):
+        n = min(block_seconds * FPS, int(seconds * FPS) - block_start)
+        tone = 0.5 * np.sin(2 * np.pi * 440.0 * (block_start + np.arange(n)) / FPS)
+        for start, end in silences:
+            i0, i1 = int(start * FPS) - block_start, int(end * FPS) - block_start
+            if i1 > 0 and i0 < n:
+                tone[max(i0, 0):min(i1, n)] = 0.0
+        proc.stdin.write((tone * 32767).astype("<i2").tobytes())
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to generate {path}")
+
+    with open(path + ".json", "w") as f:
+        json.dump({"seconds": seconds, "seed": seed, "planted": planted, "short": short}, f)
+
+
+def media_for(media_dir, seconds):
+    path = os.path.join(media_dir, f"synthetic-{seconds}s.mp4")
+    if not os.path.exists(path + ".json"):
+        print(f"Generating {seconds} s of synthetic media")
+        generate_media(path, seconds)
+    with open(path + ".json") as f:
+        return path, json.load(f)
+
+
+def compare_ranges(detected, planted, tolerance):
+    errors = [max(abs(a[0] - b[0]), abs(a[1] - b[1])) for a, b in zip(detected, planted)]
+    max_error = max(errors) if errors else 0.0
+    return {"detected": len(detected), "planted": len(planted), "max_boundary_error": max_error,
+            "match": len(detected) == len(planted) and max_error <= tolerance}
+
+
+# The detector each script builds from its default options, and its precision: per-sample for
+# the simple remover, one window for the optimized one, one 32 ms frame for --detector speech
+IMPLEMENTATIONS = {
+    "video-silence-remover": (SampleDetector(0.01, MIN_SILENCE_DURATION), 0.1),
+    "optimized-video-silence-remover": (WindowDetector(-50.0, MIN_SILENCE_DURATION, window_ms=1000), 1.0),
+    "speech-detector": (SpeechDetector(-45.0, MIN_SILENCE_DURATION), 0.1),
+}
+
+
+def timed(func, *args, **kwargs):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args, **kwargs)
+    return result, {"wall_s": time.perf_counter() - wall, "cpu_s": time.process_time() - cpu}
+
+
+def bench(name, remover, path, layout, encode, workdir, jobs=2):
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
+    detector, tolerance = IMPLEMENTATIONS[name]
+    result = {"implementation": name, "media_seconds": layout["seconds"], "stages": {}}
+    stages = result["stages"]
+
+    silent_ranges, stages["detect"] = timed(detector.detect, path, remover.probe_media(path), cache_dir=None)
+    result["ranges"] = compare_ranges(silent_ranges, layout["planted"], tolerance)
+
+    video = VideoFileClip(path)
+    keep = remover.keep_ranges(silent_ranges, video.duration)
+    final_clip, stages["cut"] = timed(
+        lambda: concatenate_videoclips([video.subclip(start, end) for start, end in keep]))
+
+    _, stages["stream_copy"] = timed(remover.stream_copy_cut, path, os.path.join(workdir, "copy.mp4"), keep)
+    if encode:
+        _, stages["encode"] = timed(final_clip.write_videofile, os.path.join(workdir, "encode.mp4"),
+                                    codec="libx264", audio_codec="aac", logger=None,
+                                    temp_audiofile=os.path.join(workdir, "encode_audio.m4a"))
+        # The --jobs path on the same kept ranges, against the single-process encode above
+        _, stages["parallel_encode"] = timed(remover.parallel_encode, path, os.path.join(workdir, "parallel.mp4"),
+                                             keep, jobs)
+        stages["parallel_encode"]["jobs"] = jobs
+        result["parallel_speedup"] = stages["encode"]["wall_s"] / stages["parallel_encode"]["wall_s"]
+    video.close()
+
+    for stage in stages.values():
+        stage["realtime_factor"] = layout["seconds"] / stage["wall_s"] if stage["wall_s"] else None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark both silence removers on synthetic media.")
+    parser.add_argument("--sizes", default="60,600,3600,10800",
+                        help="Comma-separated media lengths in seconds (default: 1 min, 10 min, 1 h, 3 h)")
+    parser.add_argument("--implementations", default=",".join(IMPLEMENTATIONS),
+                        help="Comma-separated detectors to benchmark (default: all)")
+    parser.add_argument("--media-dir", default=os.path.join(tempfile.gettempdir(), "silence-remover-bench"),
+                        help="Where generated media is kept between runs")
+    parser.add_argument("--encode-max", type=float, default=600,
+                        help="Only time the full re-encode for media up to this many seconds (default: 600)")
+    parser.add_argument("--jobs", type=int, default=max(2, os.cpu_count() or 1),
+                        help="Worker processes for the parallel encode stage (default: one per CPU core, at least 2)")
+    parser.add_argument("--output", default="silence_remover_bench.json", help="JSON results file")
+    args = parser.parse_args()
+
+    os.makedirs(args.media_dir, exist_ok=True)
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "numpy": np.__version__, "cpus": os.cpu_count()},
+        "results": [],
+    }
+
+    for seconds in [int(s) for s in args.sizes.split(",")]:
+        path, layout = media_for(args.media_dir, seconds)
+        for name in args.implementations.split(","):
+            with tempfile.TemporaryDirectory() as workdir:
+                result = bench(name, silence_remover, path, layout, seconds <= args.encode_max, workdir, args.jobs)
+            report["results"].append(result)
+            stages = ", ".join(f"{stage} {timing['wall_s']:.2f} s" for stage, timing in result["stages"].items())
+            speedup = (f"; --jobs {args.jobs} speedup over one process: {result['parallel_speedup']:.2f}x"
+                       if "parallel_speedup" in result else "")
+            print(f"{name} {seconds} s: {stages}; ranges match: {result['ranges']['match']}{speedup}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
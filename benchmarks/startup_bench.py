@@ -0,0 +1,70 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ("video-silence-remover.py", "optimized-video-silence-remover.py")
+
+
+def time_command(cmd, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+# Cumulative import time in seconds of every module imported at startup, from python -X importtime,
+# and which of them were imported by the script itself rather than by another module
+def import_times(cmd):
+    log = subprocess.run([sys.executable, "-X", "importtime"] + cmd, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE).stderr.decode(errors="replace")
+    times, top_level = {}, []
+    for cumulative_us, name in re.findall(r"import time:\s+\d+ \|\s+(\d+) \|( *\S+)", log):
+        times[name.strip()] = int(cumulative_us) / 1e6
+        if not name.startswith("  "):
+            top_level.append(name.strip())
+    return times, top_level
+
+
+# The scripts as they were at a git revision, for a before/after comparison
+def checkout_scripts(revision, workdir):
+    for name in SCRIPTS + ("silence_remover.py",):
+        result = subprocess.run(["git", "-C", ROOT, "show", f"{revision}:{name}"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        if result.returncode == 0:
+            with open(os.path.join(workdir, name), "wb") as f:
+                f.write(result.stdout)
+    return workdir
+
+
+def bench(label, directory, runs):
+    for script in SCRIPTS:
+        path = os.path.join(directory, script)
+        best, median = time_command([sys.executable, path, "--help"], runs)
+        imports, top_level = import_times([path, "--help"])
+        slowest = sorted(top_level, key=lambda name: -imports[name])[:3]
+        print(f"{label:>8} {script:<38} --help: best {best:.3f} s, median {median:.3f} s; "
+              f"moviepy loaded: {'moviepy' in imports}; slowest imports: "
+              + ", ".join(f"{name} {imports[name]:.3f} s" for name in slowest))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time how long both silence removers take to start.")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per command (default: 10)")
+    parser.add_argument("--against", metavar="REVISION",
+                        help="Also time the scripts as they were at this git revision")
+    args = parser.parse_args()
+
+    best, median = time_command([sys.executable, "-c", "pass"], args.runs)
+    print(f"Interpreter alone: best {best:.3f} s, median {median:.3f} s")
+    bench("current", ROOT, args.runs)
+    if args.against:
+        with tempfile.TemporaryDirectory() as workdir:
+            bench(args.against, checkout_scripts(args.against, workdir), args.runs)
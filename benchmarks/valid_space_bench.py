@@ -0,0 +1,87 @@
+import argparse
+import importlib.util
+import os
+import random
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+
+# The file name has dots in it, so it is loaded by path; the game only starts when run as a script
+def load_tetris():
+    spec = importlib.util.spec_from_file_location("tetris_o1_p", os.path.join(ROOT, "tetris.o1.p.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# valid_space as it was before the bitboard: a list of the free cells is rebuilt on every call
+def valid_space_list(tetris, shape, grid):
+    accepted_positions = [[(x, y) for x in range(10) if grid[y][x] == (0,0,0)] for y in range(20)]
+    accepted_positions = [pos for sublist in accepted_positions for pos in sublist]
+
+    formatted = tetris.convert_shape_format(shape)
+
+    for pos in formatted:
+        if pos not in accepted_positions:
+            if pos[1] > -1:
+                return False
+    return True
+
+
+# A board with its bottom rows partly filled, like one in the middle of a game
+def random_locked(tetris, rng, height):
+    return {(x, y): rng.choice(tetris.shape_colors)
+            for y in range(20 - height, 20) for x in range(10) if rng.random() < 0.7}
+
+
+# Every shape and rotation at positions from well outside the board to well inside it
+def random_pieces(tetris, rng, count):
+    pieces = []
+    for _ in range(count):
+        piece = tetris.Piece(rng.randint(-4, 14), rng.randint(-3, 25), rng.choice(tetris.shapes))
+        piece.rotation = rng.randint(0, 7)
+        pieces.append(piece)
+    return pieces
+
+
+def check_regressions(tetris, boards, pieces):
+    for locked in boards:
+        grid, rows = tetris.create_grid(locked), tetris.board_rows(locked)
+        for piece in pieces:
+            expected = valid_space_list(tetris, piece, grid)
+            actual = tetris.valid_space(piece, rows)
+            assert actual == expected, (piece.x, piece.y, piece.rotation, actual, expected)
+    print(f"Regression check passed on {len(boards)} boards x {len(pieces)} pieces")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark valid_space in tetris.o1.p.py.")
+    parser.add_argument("--calls", type=int, default=20000, help="Calls timed per implementation (default: 20000)")
+    parser.add_argument("--height", type=int, default=8, help="Filled rows on the benchmark board (default: 8)")
+    args = parser.parse_args()
+
+    tetris = load_tetris()
+    rng = random.Random(0)
+    check_regressions(tetris, [random_locked(tetris, rng, height) for height in range(0, 21, 2)],
+                      random_pieces(tetris, rng, 2000))
+
+    locked = random_locked(tetris, rng, args.height)
+    grid, rows = tetris.create_grid(locked), tetris.board_rows(locked)
+    # Pieces where the game checks them: inside the board or one step past its edges
+    pieces = [tetris.Piece(rng.randint(0, 11), rng.randint(0, 21), rng.choice(tetris.shapes))
+              for _ in range(256)]
+    for piece in pieces:
+        piece.rotation = rng.randint(0, 3)
+
+    def run(check, board):
+        for i in range(args.calls):
+            check(pieces[i % len(pieces)], board)
+
+    list_time = min(timeit.repeat(lambda: run(lambda piece, board: valid_space_list(tetris, piece, board), grid),
+                                  number=1, repeat=3))
+    bitboard_time = min(timeit.repeat(lambda: run(tetris.valid_space, rows), number=1, repeat=3))
+    print(f"list:     {list_time / args.calls * 1e6:.2f} us per call")
+    print(f"bitboard: {bitboard_time / args.calls * 1e6:.2f} us per call")
+    print(f"speedup:  {list_time / bitboard_time:.1f}x")
@@ -0,0 +1,816 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import numpy as np
+from silence_remover import iter_pcm_blocks, probe_media, window_loudness, window_samples
+
+def list_dir(directory, subdir, extension=".mp4"):
+    # Paths are relative to directory. Names come back as-is, including ones with newlines or
+    # leading dashes, and files deleted while being listed are skipped
+    sources, files, subdirs = {}, set(), []
+    with os.scandir(os.path.join(directory, subdir)) as entries:
+        for entry in entries:
+            path = os.path.join(subdir, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(path)
+            elif entry.is_file():
+                files.add(path)
+                if entry.name.lower().endswith(extension):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    sources[path] = (stat.st_size, stat.st_mtime_ns)
+    return sources, files, subdirs
+
+def scan(directory, extension=".mp4"):
+    # One scandir per directory: the listing doubles as the existence check for outputs, so an
+    # unchanged tree costs one stat per source
+    sources, files = {}, set()
+    stack = [""]
+    while stack:
+        dir_sources, dir_files, subdirs = list_dir(directory, stack.pop(), extension)
+        sources.update(dir_sources)
+        files |= dir_files
+        stack.extend(subdirs)
+    return sources, files
+
+class TreeWatcher(object):
+    # Keeps the listing of a tree current by polling. Every poll stats each directory but lists again
+    # only those whose mtime changed, which is where files were created, renamed or deleted. A file
+    # rewritten in place leaves its directory alone, so sources are statted one by one as well: those
+    # that changed in the last hot_seconds on every poll, and all of them every sweep_every polls
+    def __init__(self, directory, extension=".mp4", sweep_every=30, hot_seconds=60.0):
+        self.directory = directory
+        self.extension = extension
+        self.sweep_every, self.hot_seconds = sweep_every, hot_seconds
+        self.listings = {}
+        self.sources, self.files = {}, set()
+        self.hot, self.polls = {}, 0
+
+    def poll(self, watched=()):
+        # Returns the sources of every directory listed again and the other sources whose size or
+        # mtime changed, and the sources that disappeared. The sources in watched are statted on every
+        # poll too, for callers waiting on them
+        changed, removed = {}, set()
+        seen, stack = set(), [""]
+        now = time.monotonic()
+        while stack:
+            subdir = stack.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self.directory, subdir)).st_mtime_ns
+                listing = self.listings.get(subdir)
+                if listing is None or listing[0] != mtime_ns:
+                    previous = listing[1] if listing else {}
+                    listing = (mtime_ns,) + list_dir(self.directory, subdir, self.extension)
+                    removed |= self.forget(subdir) - listing[1].keys()
+                    self.listings[subdir] = listing
+                    self.sources.update(listing[1])
+                    self.files |= listing[2]
+                    changed.update(listing[1])
+                    # The first poll finds every source new; only later arrivals are worth watching closely
+                    if self.polls:
+                        self.hot.update((source, now) for source, stat in listing[1].items()
+                                        if previous.get(source) != stat)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            seen.add(subdir)
+            stack.extend(listing[3])
+        for subdir in set(self.listings) - seen:
+            removed |= self.forget(subdir)
+
+        self.polls += 1
+        statted = self.sources if self.polls % self.sweep_every == 0 else set(self.hot).union(watched)
+        restatted = {}
+        for source in statted:
+            if source in changed or source not in self.sources:
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, source))
+            except FileNotFoundError:
+                continue
+            if (st.st_size, st.st_mtime_ns) != self.sources[source]:
+                restatted[source] = (st.st_size, st.st_mtime_ns)
+                self.hot[source] = now
+        changed.update(restatted)
+        self.sources.update(restatted)
+        self.hot = {source: at for source, at in self.hot.items()
+                    if now - at < self.hot_seconds and source in self.sources}
+        return changed, removed
+
+    def forget(self, subdir):
+        listing = self.listings.pop(subdir, None)
+        if listing is None:
+            return set()
+        for source in listing[1]:
+            del self.sources[source]
+        self.files -= listing[2]
+        return set(listing[1])
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def display(path):
+    return path if path.isprintable() else repr(path)
+
+# Audio codecs that can be extracted without re-encoding, and the container each is written to
+COPY_CONTAINERS = {"mp3": ".mp3", "aac": ".m4a", "alac": ".m4a", "flac": ".flac", "opus": ".opus", "vorbis": ".ogg"}
+
+def probe_audio_codec(ffmpeg, input_file):
+    # ffmpeg -i without an output lists the streams and exits with an error, which is expected here
+    cmd = [ffmpeg, "-hide_banner", "-nostdin", "-i", "file:" + input_file]
+    log = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode(errors="replace")
+    codec = re.search(r"Stream #\S+.*?: Audio: (\w+)", log)
+    return codec.group(1) if codec else None
+
+class Mp3Encoder(object):
+    # An ffmpeg MP3 encoder fed raw float PCM through its stdin
+    def __init__(self, ffmpeg, output_file, fps, nchannels, quality=2):
+        self.output_file = output_file
+        cmd = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-n", "-f", "f32le", "-ar", str(fps),
+               "-ac", str(nchannels), "-i", "pipe:0", "-acodec", "libmp3lame", "-q:a", str(quality),
+               "file:" + output_file]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def write(self, samples):
+        self.proc.stdin.write(samples.tobytes())
+
+    def close(self):
+        self.proc.stdin.close()
+        errors = self.proc.stderr.read().decode(errors="replace").strip()
+        if self.proc.wait() != 0:
+            raise IOError(f"ffmpeg failed to encode {self.output_file}: {errors}")
+
+class SilenceTrimmer(object):
+    # Passes on only the audio outside silences, with the semantics of optimized-video-silence-remover.py:
+    # back-to-back windows of window_ms whose peak is below threshold dBFS, removed in runs lasting at
+    # least min_silence_duration. A silent run is held until it is either long enough to drop or ends,
+    # so at most min_silence_duration of audio is buffered
+    def __init__(self, encoder, fps, nchannels, threshold=-50.0, min_silence_duration=10, window_ms=1000):
+        self.encoder = encoder
+        self.window = window_samples(fps, window_ms)[0]
+        self.linear = 10 ** (threshold / 20)
+        self.min_samples = min_silence_duration * fps
+        self.carry = np.zeros((0, nchannels), dtype=np.float32)
+        self.held, self.held_samples, self.dropping = [], 0, False
+
+    def write(self, samples):
+        # Only whole windows are classified; the rest waits for the next block
+        samples = np.concatenate((self.carry, samples)) if len(self.carry) else samples
+        n = len(samples) // self.window * self.window
+        self.carry = samples[n:].copy()
+        self.classify(samples[:n], self.window)
+
+    def classify(self, samples, window):
+        if not len(samples):
+            return
+        silent = window_loudness(samples.reshape(-1, window * samples.shape[1]))[0] < self.linear
+        bounds = np.concatenate(([0], np.flatnonzero(silent[1:] != silent[:-1]) + 1, [len(silent)])) * window
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if not silent[start // window]:
+                self.flush()
+                self.dropping = False
+                self.encoder.write(samples[start:end])
+            elif not self.dropping:
+                self.held.append(samples[start:end].copy())
+                self.held_samples += end - start
+                if self.held_samples >= self.min_samples:
+                    self.held, self.held_samples, self.dropping = [], 0, True
+
+    def flush(self):
+        for run in self.held:
+            self.encoder.write(run)
+        self.held, self.held_samples = [], 0
+
+    def close(self):
+        # The last window may be short; a trailing silence shorter than the minimum is kept
+        self.classify(self.carry, len(self.carry))
+        if not self.dropping:
+            self.flush()
+        self.encoder.close()
+
+class WaveformPeaks(object):
+    # Min/max pairs of every samples_per_pixel samples across all channels, in the 8-bit version 1
+    # audiowaveform .dat format that browser waveform players load
+    def __init__(self, path, fps, nchannels, samples_per_pixel=512):
+        self.span = samples_per_pixel
+        self.carry = np.zeros((0, nchannels), dtype=np.float32)
+        self.length = 0
+        self.file = open(path, "wb")
+        self.file.write(struct.pack("<iIiiI", 1, 1, fps, samples_per_pixel, 0))
+
+    def write(self, samples):
+        samples = np.concatenate((self.carry, samples)) if len(self.carry) else samples
+        n = len(samples) // self.span * self.span
+        self.carry = samples[n:].copy()
+        self.write_pairs(samples[:n].reshape(-1, self.span * samples.shape[1]))
+
+    def write_pairs(self, frames):
+        if not len(frames):
+            return
+        pairs = np.empty((len(frames), 2), dtype=np.int8)
+        pairs[:, 0] = np.clip(np.round(frames.min(axis=1) * 127), -128, 127)
+        pairs[:, 1] = np.clip(np.round(frames.max(axis=1) * 127), -128, 127)
+        self.file.write(pairs.tobytes())
+        self.length += len(frames)
+
+    def close(self):
+        self.write_pairs(self.carry.reshape(1, -1) if len(self.carry) else self.carry)
+        # The pair count in the header is only known at the end
+        self.file.seek(16)
+        self.file.write(struct.pack("<I", self.length))
+        self.file.close()
+
+def decode_to_outputs(ffmpeg, input_file, fps, nchannels, outputs, block_seconds=10, progress=None,
+                      media_seconds=0.0):
+    # One decode feeds every output; each copies what it keeps, as the block buffer is reused
+    started, samples = time.perf_counter(), 0
+    try:
+        for block in iter_pcm_blocks(input_file, fps, nchannels, fps * block_seconds, ffmpeg):
+            for output in outputs:
+                output.write(block)
+            samples += len(block)
+            if progress:
+                progress(samples / fps, media_seconds, samples / fps / max(time.perf_counter() - started, 1e-9))
+    finally:
+        for output in outputs:
+            output.close()
+
+def parse_duration(log):
+    duration = re.search(r"Duration: (\d+):(\d+):([0-9.]+)", log)
+    if not duration:
+        return 0.0
+    return int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3))
+
+def run_ffmpeg(cmd, progress=None):
+    # With -progress, ffmpeg writes a block of key=value lines to stdout twice a second, ending each
+    # with progress=. Its log is drained on a thread so that neither pipe fills up and stalls it.
+    # progress is called with the media seconds done, the duration and ffmpeg's speed
+    proc = subprocess.Popen(cmd[:1] + ["-progress", "pipe:1"] + cmd[1:], stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    lines = []
+
+    def drain():
+        for line in proc.stderr:
+            lines.append(line)
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    done, speed, media_seconds = 0.0, 0.0, 0.0
+    for line in proc.stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        if key in ("out_time_us", "out_time_ms") and value.isdigit():
+            done = int(value) / 1e6
+        elif key == "speed" and value.endswith("x"):
+            try:
+                speed = float(value[:-1])
+            except ValueError:
+                pass
+        elif key == "progress" and progress:
+            # The input's duration is in the log by the time the first block arrives
+            media_seconds = media_seconds or parse_duration(b"".join(lines).decode(errors="replace"))
+            progress(done, media_seconds, speed)
+    reader.join()
+    returncode = proc.wait()
+    return returncode, b"".join(lines).decode(errors="replace")
+
+def entry_outputs(entry):
+    return [entry["output"]] + entry.get("extra", [])
+
+def failed_stats(error):
+    return {"seconds": 0.0, "media_seconds": 0.0, "bytes": 0, "bytes_out": 0, "error": error, "hash": None,
+            "outputs": [], "converted": False, "copied": False}
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def convert(ffmpeg, input_file, stem, settings, known_hash=None, old_outputs=(), progress=None):
+    # A source that is deleted or renamed before or during its conversion fails on its own, and the
+    # outputs it leaves behind go with it; they would have no manifest entry to be cleaned up by
+    try:
+        content_hash = file_hash(input_file)
+    except OSError as e:
+        if not os.path.exists(input_file):
+            remove_files(old_outputs)
+        return failed_stats(str(e))
+    # A source whose mtime changed but whose content did not is only re-hashed
+    if content_hash == known_hash:
+        return {"seconds": 0.0, "media_seconds": 0.0, "bytes": 0, "bytes_out": 0, "error": None, "hash": content_hash,
+                "outputs": list(old_outputs), "converted": False, "copied": False}
+    remove_files(old_outputs)
+
+    # With stream_copy, audio that a container can hold as it is gets copied there, which is
+    # bound by disk speed; anything else is transcoded to MP3
+    codec = probe_audio_codec(ffmpeg, input_file) if settings.get("stream_copy") else None
+    copy = codec in COPY_CONTAINERS
+    outputs = [stem + (COPY_CONTAINERS[codec] if copy else ".mp3")]
+    if settings.get("trimmed"):
+        outputs.append(stem + ".trimmed.mp3")
+    if settings.get("peaks"):
+        outputs.append(stem + ".peaks.dat")
+    remove_files(outputs)
+
+    started = time.perf_counter()
+    error, media_seconds = None, 0.0
+    if copy or len(outputs) == 1:
+        if copy:
+            codec_args = ["-map", "0:a:0", "-c:a", "copy"]
+        else:
+            codec_args = ["-acodec", "libmp3lame", "-q:a", str(settings["quality"])]
+        # The file: prefix stops ffmpeg from reading a colon in the name as a protocol, and -nostdin
+        # keeps parallel ffmpegs from competing for the terminal
+        cmd = [ffmpeg, "-hide_banner", "-nostdin", "-nostats", "-n", "-i", "file:" + input_file,
+               "-vn"] + codec_args + ["file:" + outputs[0]]
+        returncode, log = run_ffmpeg(cmd, progress)
+        media_seconds = parse_duration(log)
+        if returncode != 0:
+            error = log.strip().splitlines()[-1] if log.strip() else f"ffmpeg exited with {returncode}"
+
+    if len(outputs) > 1 and error is None:
+        # The trimmed MP3 and the peaks (and the full MP3 unless it was copied) share one decode
+        try:
+            media = probe_media("file:" + input_file, ffmpeg)
+            fps, nchannels, media_seconds = media["fps"], media["nchannels"], media["duration"]
+            sinks = [] if copy else [Mp3Encoder(ffmpeg, outputs[0], fps, nchannels, settings["quality"])]
+            if settings.get("trimmed"):
+                encoder = Mp3Encoder(ffmpeg, outputs[1], fps, nchannels, settings["quality"])
+                sinks.append(SilenceTrimmer(encoder, fps, nchannels, **settings["trimmed"]))
+            if settings.get("peaks"):
+                sinks.append(WaveformPeaks(outputs[-1], fps, nchannels, settings["peaks"]["samples_per_pixel"]))
+            decode_to_outputs(ffmpeg, "file:" + input_file, fps, nchannels, sinks, progress=progress,
+                              media_seconds=media_seconds)
+        except (IOError, OSError) as e:
+            error = str(e)
+    seconds = time.perf_counter() - started
+    try:
+        size = os.path.getsize(input_file)
+    except OSError as e:
+        error, size = error or str(e), 0
+
+    if error:
+        # A partial output would be taken as already converted on the next run
+        remove_files(outputs)
+    bytes_out = sum(os.path.getsize(path) for path in outputs if os.path.exists(path))
+    return {"seconds": seconds, "media_seconds": media_seconds, "bytes": size,
+            "bytes_out": bytes_out, "error": error, "hash": content_hash, "outputs": outputs, "converted": True,
+            "copied": copy}
+
+def convert_settings(quality, stream_copy=False, trimmed=None, peaks=None):
+    # Stored in the manifest: changing any of them makes every entry stale
+    settings = {"encoder": "libmp3lame", "quality": quality}
+    if stream_copy:
+        settings["stream_copy"] = True
+    if trimmed:
+        settings["trimmed"] = trimmed
+    if peaks:
+        settings["peaks"] = peaks
+    return settings
+
+def plan(sources, files, entries, current, adopt=True):
+    # Sources to convert, with the hash a touched source is checked against, and sources whose MP3
+    # predates the manifest (or comes from the shell script) and is kept as it is
+    pending, adopted = {}, []
+    for source, (size, mtime_ns) in sources.items():
+        entry = entries.get(source)
+        output = entry["output"] if entry else os.path.splitext(source)[0] + ".mp3"
+        if entry and current and all(path in files for path in entry_outputs(entry)):
+            if entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+                continue
+            pending[source] = entry["hash"] if entry["size"] == size else None
+        elif output in files and adopt and not entry:
+            adopted.append(source)
+        else:
+            pending[source] = None
+    return pending, adopted
+
+def adopt_outputs(entries, sources, adopted):
+    # Adopted entries get their hash later, from hash_adopted on the worker pool
+    for source in adopted:
+        size, mtime_ns = sources[source]
+        entries[source] = {"size": size, "mtime_ns": mtime_ns, "hash": None,
+                           "output": os.path.splitext(source)[0] + ".mp3"}
+
+def adopted_hash(path, size, mtime_ns):
+    # None if the source changed since it was adopted, as the hash would then describe other content
+    content_hash = file_hash(path)
+    st = os.stat(path)
+    return content_hash if (st.st_size, st.st_mtime_ns) == (size, mtime_ns) else None
+
+def hash_adopted(pool, directory, entries, adopted):
+    # Queued behind the conversions already submitted, so hashing a large tree does not hold them up
+    return {pool.submit(adopted_hash, os.path.join(directory, source), entries[source]["size"],
+                        entries[source]["mtime_ns"]): source for source in adopted}
+
+def record_hash(entries, source, future):
+    # A source converted or removed in the meantime already has its hash, or no entry
+    entry = entries.get(source)
+    if entry and entry["hash"] is None and future.exception() is None:
+        entry["hash"] = future.result()
+
+def remove_outputs(directory, entry):
+    # The outputs of a source that disappeared go with it
+    for output in entry_outputs(entry):
+        path = os.path.join(directory, output)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"[removed] {display(path)}")
+
+def submit(pool, ffmpeg, directory, entries, settings, source, known_hash, progress=None):
+    old_outputs = [os.path.join(directory, path) for path in entry_outputs(entries[source])] \
+        if source in entries else []
+    return pool.submit(convert, ffmpeg, os.path.join(directory, source),
+                       os.path.join(directory, os.path.splitext(source)[0]), settings, known_hash, old_outputs,
+                       progress)
+
+def record(directory, entries, source, size, mtime_ns, stats):
+    # Updates the manifest entry of a finished conversion and returns the line reporting it, if any
+    input_file = os.path.join(directory, source)
+    if stats["error"]:
+        entries.pop(source, None)
+        return f"[failed] {display(input_file)}: {stats['error']}"
+    outputs = [os.path.relpath(path, directory) for path in stats["outputs"]]
+    entries[source] = {"size": size, "mtime_ns": mtime_ns, "hash": stats["hash"], "output": outputs[0]}
+    if len(outputs) > 1:
+        entries[source]["extra"] = outputs[1:]
+    if stats["converted"]:
+        return (f"[{'copied' if stats['copied'] else 'done'}] {display(input_file)}: "
+                f"{stats['seconds']:.1f} s, "
+                f"{stats['media_seconds'] / stats['seconds']:.0f}x realtime, "
+                f"{stats['bytes'] / 2 ** 20 / stats['seconds']:.1f} MB/s")
+    return None
+
+def outcome(future):
+    # A conversion that raised is reported like one that failed, so one file cannot stop the run
+    try:
+        return future.result()
+    except Exception as e:
+        return failed_stats(repr(e))
+
+def clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class ProgressBoard(object):
+    # Live progress of a batch, fed from the worker threads. Overall progress and the ETA are counted
+    # in source bytes, which are known up front, unlike durations. On a terminal one status line is
+    # redrawn in place; otherwise a line is printed every log_interval seconds
+    def __init__(self, total_files, total_bytes, stream=sys.stdout, log_interval=30.0):
+        self.total_files, self.total_bytes = total_files, total_bytes
+        self.stream = stream
+        self.tty = stream.isatty()
+        self.interval = 0.5 if self.tty else log_interval
+        self.lock = threading.Lock()
+        self.started = self.last = time.perf_counter()
+        self.active = {}
+        self.done_files, self.done_bytes, self.done_media = 0, 0, 0.0
+
+    def tracker(self, name, size):
+        # The progress callback handed to convert() for one file
+        def progress(done, media_seconds, speed):
+            with self.lock:
+                self.active[name] = (size, min(done / media_seconds, 1.0) if media_seconds else 0.0, done, speed)
+                if time.perf_counter() - self.last >= self.interval:
+                    self.render()
+        return progress
+
+    def finish(self, name, size, stats, message=None):
+        with self.lock:
+            self.active.pop(name, None)
+            self.done_files += 1
+            self.done_bytes += size
+            self.done_media += stats["media_seconds"]
+            if message:
+                self.clear()
+                print(message, file=self.stream)
+            if self.tty or time.perf_counter() - self.last >= self.interval:
+                self.render()
+
+    def render(self):
+        self.last = time.perf_counter()
+        elapsed = self.last - self.started
+        done_bytes = self.done_bytes + sum(size * fraction for size, fraction, _, _ in self.active.values())
+        media = self.done_media + sum(done for _, _, done, _ in self.active.values())
+        fraction = done_bytes / self.total_bytes if self.total_bytes else 1.0
+        eta = clock(elapsed * (1 - fraction) / fraction) if fraction > 0 else "?"
+        line = (f"[progress] {self.done_files}/{self.total_files} files, {fraction:.1%} of "
+                f"{self.total_bytes / 2 ** 20:.0f} MB, {media / elapsed if elapsed else 0:.0f}x realtime, "
+                f"{done_bytes / 2 ** 20 / elapsed if elapsed else 0:.1f} MB/s, ETA {eta}")
+        line += "".join(f"; {display(os.path.basename(name))} {fraction:.0%} {speed:.0f}x"
+                        for name, (_, fraction, _, speed) in self.active.items())
+        if self.tty:
+            width = shutil.get_terminal_size().columns
+            self.stream.write("\r" + line[:width - 1] + "\033[K")
+            self.stream.flush()
+        else:
+            print(line, file=self.stream)
+
+    def clear(self):
+        if self.tty:
+            self.stream.write("\r\033[K")
+
+    def close(self):
+        with self.lock:
+            self.clear()
+            self.stream.flush()
+
+def write_summary(path, directory, wall, results):
+    # Per-file and total timings and sizes of a run, for comparing runs and spotting slow storage or inputs
+    files = []
+    for source, stats in results:
+        files.append({"input": source, "outputs": [os.path.relpath(path, directory) for path in stats["outputs"]],
+                      "bytes_in": stats["bytes"], "bytes_out": stats["bytes_out"], "seconds": stats["seconds"],
+                      "media_seconds": stats["media_seconds"],
+                      "speed": stats["media_seconds"] / stats["seconds"] if stats["seconds"] else None,
+                      "converted": stats["converted"], "copied": stats["copied"], "error": stats["error"]})
+    converted = [stats for _, stats in results if stats["converted"] and not stats["error"]]
+    encode_seconds = sum(stats["seconds"] for stats in converted)
+    media_seconds = sum(stats["media_seconds"] for stats in converted)
+    bytes_in = sum(stats["bytes"] for stats in converted)
+    totals = {"files": len(results), "converted": len(converted),
+              "failed": sum(1 for _, stats in results if stats["error"]),
+              "bytes_in": bytes_in, "bytes_out": sum(stats["bytes_out"] for stats in converted),
+              "wall_seconds": wall, "encode_seconds": encode_seconds, "media_seconds": media_seconds,
+              "average_speed": media_seconds / encode_seconds if encode_seconds else None,
+              "realtime_factor": media_seconds / wall if wall else None,
+              "mb_per_second": bytes_in / 2 ** 20 / wall if wall else None}
+    with open(path, "w") as f:
+        json.dump({"directory": directory, "totals": totals, "files": files}, f, indent=2)
+
+def convert_all(directory, jobs, quality=2, overwrite=False, manifest_path=None, stream_copy=False,
+                trimmed=None, peaks=None, summary_path=None, save_interval=5.0):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is not installed or not on PATH")
+
+    # Every converted source is recorded with its size, mtime, content hash and outputs
+    manifest_path = manifest_path or os.path.join(directory, ".mp4-to-mp3-manifest.json")
+    settings = convert_settings(quality, stream_copy, trimmed, peaks)
+    manifest = load_manifest(manifest_path)
+    entries = manifest.get("files", {})
+    current = manifest.get("settings") == settings and not overwrite
+    sources, files = scan(directory)
+    pending, adopted = plan(sources, files, entries, current, adopt=not (overwrite or trimmed or peaks))
+
+    orphans = [source for source in entries if source not in sources]
+    for source in orphans:
+        remove_outputs(directory, entries.pop(source))
+    adopt_outputs(entries, sources, adopted)
+    manifest = {"settings": settings, "files": entries}
+    if orphans or adopted or pending:
+        save_manifest(manifest_path, manifest)
+    print(f"{len(sources) - len(pending)} of {len(sources)} MP4 files up to date, {len(orphans)} orphaned outputs "
+          f"removed; converting {len(pending)} in {display(directory)} with {jobs} workers")
+
+    started = last_save = time.perf_counter()
+    done, failed, unchanged, results = [], [], 0, []
+    board = ProgressBoard(len(pending), sum(sources[source][0] for source in pending))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {submit(pool, ffmpeg, directory, entries, settings, source, known_hash,
+                          board.tracker(source, sources[source][0])): source
+                   for source, known_hash in pending.items()}
+        hashes = hash_adopted(pool, directory, entries, adopted)
+        for future in as_completed(list(futures) + list(hashes)):
+            if future in hashes:
+                record_hash(entries, hashes[future], future)
+                continue
+            source = futures[future]
+            stats = outcome(future)
+            results.append((source, stats))
+            message = record(directory, entries, source, *sources[source], stats)
+            board.finish(source, sources[source][0], stats, message)
+            if stats["error"]:
+                failed.append(os.path.join(directory, source))
+            elif not stats["converted"]:
+                unchanged += 1
+            else:
+                done.append(stats)
+            # Saved every few seconds rather than after every file, which would be quadratic on large trees
+            if time.perf_counter() - last_save > save_interval:
+                save_manifest(manifest_path, manifest)
+                last_save = time.perf_counter()
+    board.close()
+    if pending or adopted:
+        save_manifest(manifest_path, manifest)
+    wall = time.perf_counter() - started
+    if summary_path:
+        write_summary(summary_path, directory, wall, results)
+
+    if unchanged:
+        print(f"{unchanged} touched files had unchanged content and were not converted again")
+    # Busy time over wall time shows how well the pool kept the workers fed
+    if done and wall > 0:
+        busy = sum(stats["seconds"] for stats in done)
+        media = sum(stats["media_seconds"] for stats in done)
+        size = sum(stats["bytes"] for stats in done)
+        copied = sum(stats["copied"] for stats in done)
+        print(f"Converted {len(done)} files ({copied} stream-copied) in {wall:.1f} s: "
+              f"{len(done) / wall:.2f} files/s, {media / wall:.0f}x realtime, {size / 2 ** 20 / wall:.1f} MB/s, "
+              f"{busy / wall:.1f} workers busy on average")
+    if failed:
+        print(f"{len(failed)} files failed")
+    return failed
+
+def watch(directory, jobs, quality=2, overwrite=False, manifest_path=None, stream_copy=False, trimmed=None,
+          peaks=None, interval=2.0, settle=5.0, queue_size=None, save_interval=5.0):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is not installed or not on PATH")
+
+    # Startup works like a one-shot run, so a restart converts only what changed while it was down,
+    # except that nothing is converted before it has settled
+    manifest_path = manifest_path or os.path.join(directory, ".mp4-to-mp3-manifest.json")
+    settings = convert_settings(quality, stream_copy, trimmed, peaks)
+    manifest = load_manifest(manifest_path)
+    entries = manifest.get("files", {})
+    current = manifest.get("settings") == settings and not overwrite
+    watcher = TreeWatcher(directory)
+    watcher.poll()
+    pending, adopted = plan(watcher.sources, watcher.files, entries, current,
+                            adopt=not (overwrite or trimmed or peaks))
+    for source in [source for source in entries if source not in watcher.sources]:
+        remove_outputs(directory, entries.pop(source))
+    adopt_outputs(entries, watcher.sources, adopted)
+    manifest = {"settings": settings, "files": entries}
+    save_manifest(manifest_path, manifest)
+    print(f"Watching {display(directory)} every {interval:g} s with {jobs} workers; "
+          f"{len(pending)} MP4 files to convert once they have not changed for {settle:g} s")
+
+    # A candidate is converted once its size and mtime have held for settle seconds. At most
+    # queue_size files are handed to the pool; the rest wait here, so a burst of uploads costs
+    # no more than a dict entry each
+    now = time.monotonic()
+    candidates = {source: [watcher.sources[source], now, known_hash] for source, known_hash in pending.items()}
+    queue_size = queue_size or 2 * jobs
+    in_flight = {}
+
+    # A service manager stops the watcher with SIGTERM, which is handled like Ctrl+C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    dirty, last_save = False, time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        hashes = hash_adopted(pool, directory, entries, adopted)
+        try:
+            while True:
+                # Sources waiting to settle or being converted are statted on every poll
+                busy = {source for source, _ in in_flight.values()}
+                changed, removed = watcher.poll(busy.union(candidates))
+                now = time.monotonic()
+                for source in removed - busy:
+                    candidates.pop(source, None)
+                    if source in entries:
+                        remove_outputs(directory, entries.pop(source))
+                        dirty = True
+                # A source converted after an upload stalled for longer than settle shows up here again
+                # once the upload resumes, and is checked against its manifest entry
+                for source, stat in changed.items():
+                    entry = entries.get(source)
+                    if source in candidates or source in busy:
+                        continue
+                    if entry and (entry["size"], entry["mtime_ns"]) == stat \
+                            and all(path in watcher.files for path in entry_outputs(entry)):
+                        continue
+                    candidates[source] = [stat, now, entry["hash"] if entry and entry["size"] == stat[0] else None]
+
+                # The poll has just statted every source, including the ones still being written
+                ready = []
+                for source, candidate in list(candidates.items()):
+                    stat = watcher.sources.get(source)
+                    if stat is None:
+                        del candidates[source]
+                        continue
+                    if stat != candidate[0]:
+                        candidate[0], candidate[1] = stat, now
+                    elif now - candidate[1] >= settle:
+                        ready.append(source)
+                for source in sorted(ready, key=lambda source: candidates[source][1])[:queue_size - len(in_flight)]:
+                    stat, _, known_hash = candidates.pop(source)
+                    future = submit(pool, ffmpeg, directory, entries, settings, source, known_hash)
+                    in_flight[future] = (source, stat)
+
+                # Waiting on the pool doubles as the poll interval, so finished files are recorded at once
+                if in_flight:
+                    finished = wait(in_flight, timeout=interval, return_when=FIRST_COMPLETED)[0]
+                else:
+                    time.sleep(interval)
+                    finished = ()
+                for future in finished:
+                    source, stat = in_flight.pop(future)
+                    message = record(directory, entries, source, *stat, outcome(future))
+                    if message:
+                        print(message)
+                    dirty = True
+                    # A source that changed while it was being converted goes round again
+                    latest = watcher.sources.get(source, stat)
+                    if latest != stat:
+                        entry = entries.get(source)
+                        candidates[source] = [latest, time.monotonic(),
+                                              entry["hash"] if entry and entry["size"] == latest[0] else None]
+                for future in [future for future in hashes if future.done()]:
+                    record_hash(entries, hashes.pop(future), future)
+                    dirty = True
+                if dirty and time.monotonic() - last_save > save_interval:
+                    save_manifest(manifest_path, manifest)
+                    dirty, last_save = False, time.monotonic()
+        except KeyboardInterrupt:
+            # Conversions that still finish are kept. A Ctrl+C reaches ffmpeg too, which stops early and
+            # fails the conversion, but a SIGTERM sent to the watcher alone lets running ones finish;
+            # pending ones are dropped either way
+            print("Stopping")
+            for future in list(in_flight) + list(hashes):
+                future.cancel()
+            for future in [future for future in hashes if future.done() and not future.cancelled()]:
+                record_hash(entries, hashes[future], future)
+            for future in wait(in_flight)[0]:
+                if not future.cancelled():
+                    source, stat = in_flight[future]
+                    message = record(directory, entries, source, *stat, outcome(future))
+                    if message:
+                        print(message)
+        finally:
+            save_manifest(manifest_path, manifest)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert every MP4 file under a directory to MP3 next to it.")
+    parser.add_argument("directory", help="Directory searched recursively for .mp4 files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Number of files converted at once (default: one per CPU core)")
+    parser.add_argument("-q", "--quality", type=int, default=2,
+                        help="LAME VBR quality, 0 (best) to 9 (default: 2)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Convert every file again, even when the manifest says its MP3 is up to date")
+    parser.add_argument("--stream-copy", action="store_true",
+                        help="Copy AAC, MP3, ALAC, FLAC, Opus and Vorbis audio into a matching container "
+                             "(.m4a, .mp3, .flac, .opus, .ogg) instead of transcoding; other codecs become MP3")
+    parser.add_argument("--trimmed", action="store_true",
+                        help="Also write NAME.trimmed.mp3 with the silences removed, from the same decode")
+    parser.add_argument("--peaks", action="store_true",
+                        help="Also write NAME.peaks.dat, 8-bit min/max waveform peaks in the audiowaveform "
+                             "format, from the same decode")
+    parser.add_argument("--silence_threshold", type=float, default=-50.0,
+                        help="Threshold for detecting silence in dB with --trimmed (default: -50.0)")
+    parser.add_argument("--min_silence_duration", type=float, default=10.0,
+                        help="Minimum duration of silence to remove in seconds with --trimmed (default: 10.0)")
+    parser.add_argument("--window-ms", type=int, default=1000,
+                        help="Length of the analysis windows in milliseconds with --trimmed (default: 1000)")
+    parser.add_argument("--samples-per-pixel", type=int, default=512,
+                        help="Samples summarised by each min/max pair with --peaks (default: 512)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and convert new or changed files once they stop changing; each file "
+                             "is reported by one line when it finishes, without the progress line")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Seconds between polls of the directory with --watch (default: 2.0)")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Seconds a file's size and mtime must hold before it is converted with --watch "
+                             "(default: 5.0)")
+    parser.add_argument("--queue-size", type=int,
+                        help="Files handed to the workers at once with --watch (default: twice the jobs)")
+    parser.add_argument("--summary", metavar="FILE",
+                        help="Write a JSON summary of the run: bytes in and out, encode seconds and speed per "
+                             "file and in total (not with --watch, which never finishes a run)")
+    parser.add_argument("--manifest",
+                        help="Manifest of converted files (default: DIRECTORY/.mp4-to-mp3-manifest.json)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"Directory {args.directory} does not exist!")
+    if args.watch and args.summary:
+        parser.error("--summary describes a finished run and cannot be used with --watch")
+    options = dict(quality=args.quality, overwrite=args.overwrite, manifest_path=args.manifest,
+                   stream_copy=args.stream_copy,
+                   trimmed=dict(threshold=args.silence_threshold, min_silence_duration=args.min_silence_duration,
+                                window_ms=args.window_ms) if args.trimmed else None,
+                   peaks=dict(samples_per_pixel=args.samples_per_pixel) if args.peaks else None)
+    if args.watch:
+        watch(args.directory, max(1, args.jobs), interval=args.interval, settle=args.settle,
+              queue_size=args.queue_size, **options)
+    else:
+        failed = convert_all(args.directory, max(1, args.jobs), summary_path=args.summary, **options)
+        sys.exit(1 if failed else 0)
@@ -1,70 +1,158 @@
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+import json
+import os
+import sys
 import numpy as np
+from silence_remover import (DEFAULT_CACHE_DIR, Profiler, SpeechDetector, WindowDetector, cached_loudness,
+                             detect_silence_windows, probe_media, remove_silence, run_batch, window_samples)
 
-def remove_silence(input_file, output_file, silence_threshold=-50.0, min_silence_duration=10):
-    video = VideoFileClip(input_file)
-    audio = video.audio
+PYRAMID_LEVELS_MS = (10, 100, 1000)
 
-    # Process audio in chunks
-    chunk_size = 1000  # 1 second chunks
-    silent_ranges = []
-    current_silent_start = None
+def build_pyramid(peaks, rms, base_hop, fps, levels=PYRAMID_LEVELS_MS):
+    # Every level is reduced from the finest one: "max" and "min" are the loudest and quietest
+    # base-window peaks inside each window, "rms" combines the base RMS values. base_hop is the base
+    # window in whole samples, so "seconds" is the real length of a window at each level
+    base_ms = levels[0]
+    pyramid = {}
+    for window_ms in levels:
+        factor = window_ms // base_ms
+        starts = np.arange(0, len(peaks), factor)
+        counts = np.diff(np.append(starts, len(peaks)))
+        pyramid[window_ms] = {
+            "max": np.maximum.reduceat(peaks, starts),
+            "min": np.minimum.reduceat(peaks, starts),
+            "rms": np.sqrt(np.add.reduceat(np.square(rms, dtype=np.float64), starts) / counts),
+            "seconds": factor * base_hop / fps,
+        }
+    return pyramid
 
-    for i in range(0, int(audio.duration * 1000), chunk_size):
-        start = i / 1000.0
-        end = min((i + chunk_size) / 1000.0, audio.duration)
-        chunk = audio.subclip(start, end)
-        
-        # Get max volume of the chunk
-        chunk_array = chunk.to_soundarray()
-        max_volume = np.abs(chunk_array).max()
+def pyramid_silence(pyramid, window_ms, duration, threshold, min_silence_duration, unit="db", metric="max"):
+    # Cost is proportional to the number of windows at the chosen level, not to the samples
+    linear = 10 ** (threshold / 20) if unit == "db" else threshold
+    threshold_db = 20 * np.log10(linear) if linear > 0 else -np.inf
+    return detect_silence_windows(pyramid[window_ms][metric], pyramid[window_ms]["seconds"], duration,
+                                  silence_threshold=threshold_db, min_silence_duration=min_silence_duration)
 
-        is_silent = max_volume < (10 ** (silence_threshold / 20))
+def sweep(input_file, thresholds, durations, unit="db", window_ms=1000, metric="max",
+          cache_dir=DEFAULT_CACHE_DIR, cache_size=1024):
+    media = probe_media(input_file)
+    fps, nchannels, duration = media["fps"], media["nchannels"], media["duration"]
 
-        if is_silent and current_silent_start is None:
-            current_silent_start = start
-        elif not is_silent and current_silent_start is not None:
-            if start - current_silent_start >= min_silence_duration:
-                silent_ranges.append((current_silent_start, start))
-            current_silent_start = None
+    base_ms = PYRAMID_LEVELS_MS[0]
+    peaks, rms = cached_loudness(input_file, fps, nchannels, base_ms, cache_dir=cache_dir, cache_size=cache_size)
+    pyramid = build_pyramid(peaks, rms, window_samples(fps, base_ms)[1], fps)
 
-    # Check if the last chunk was silent
-    if current_silent_start is not None and audio.duration - current_silent_start >= min_silence_duration:
-        silent_ranges.append((current_silent_start, audio.duration))
-
-    # Create non-silent clips
-    non_silent_clips = []
-    last_end = 0
-
-    for start, end in silent_ranges:
-        if start > last_end:
-            non_silent_clips.append(video.subclip(last_end, start))
-        last_end = end
-
-    if last_end < video.duration:
-        non_silent_clips.append(video.subclip(last_end, video.duration))
-
-    # Concatenate non-silent clips
-    if non_silent_clips:
-        final_clip = concatenate_videoclips(non_silent_clips)
-        final_clip.write_videofile(output_file, codec="libx264")
-    else:
-        print("No non-silent parts found. The entire video is silent.")
-
-    video.close()
+    print(f"{'threshold':>10} {'min_dur':>8} {'ranges':>7} {'removed_s':>10} {'removed_%':>10}")
+    for threshold in thresholds:
+        for min_silence_duration in durations:
+            silent_ranges = pyramid_silence(pyramid, window_ms, duration, threshold, min_silence_duration,
+                                            unit=unit, metric=metric)
+            removed = sum(end - start for start, end in silent_ranges)
+            print(f"{threshold:>10g} {min_silence_duration:>8g} {len(silent_ranges):>7} "
+                  f"{removed:>10.1f} {100 * removed / duration:>10.1f}")
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Remove silence from a video file.")
-    parser.add_argument("input_file", help="Path to the input video file.")
-    parser.add_argument("output_file", help="Path to the output video file.")
+    parser.add_argument("input_file", nargs="?", help="Path to the input video file.")
+    parser.add_argument("output_file", nargs="?", help="Path to the output video file.")
     parser.add_argument("--silence_threshold", type=float, default=-50.0, 
                         help="Threshold for detecting silence in dB (default: -50.0)")
     parser.add_argument("--min_silence_duration", type=float, default=10.0, 
                         help="Minimum duration of silence to remove in seconds (default: 10.0)")
+    parser.add_argument("--detector", choices=("window", "speech"), default="window",
+                        help="window: peak below --silence_threshold; speech: energy in the 300-3400 Hz band "
+                             "below --speech-threshold, which ignores hum and rumble (default: window).")
+    parser.add_argument("--speech-threshold", type=float, default=-45.0,
+                        help="Speech-band level in dBFS below which a frame is silent (default: -45.0).")
+    parser.add_argument("--window-ms", type=float, default=1000,
+                        help="Length of the analysis window in milliseconds (default: 1000).")
+    parser.add_argument("--hop-ms", type=float,
+                        help="Step between analysis windows in milliseconds (default: the window length).")
+    parser.add_argument("--stream-copy", action="store_true",
+                        help="Cut on keyframes and join with the ffmpeg concat demuxer instead of re-encoding.")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="Number of worker processes to encode with, 0 for one per CPU core (default: 0).")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Directory for cached loudness envelopes (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Cache size limit in MB; least recently used envelopes are evicted (default: 1024).")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the envelope cache.")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Print how much would be removed for a grid of parameters instead of writing a video.")
+    # Space-separated, as argparse takes a lone -60 for a negative number but -60,-50 for an option
+    parser.add_argument("--sweep-thresholds", nargs="+", type=float, default=[-60, -55, -50, -45, -40, -35, -30],
+                        help="Thresholds for --sweep (default: -60 to -30 dB in steps of 5).")
+    parser.add_argument("--sweep-durations", nargs="+", type=float, default=[1, 2, 5, 10],
+                        help="Minimum silence durations for --sweep (default: 1 2 5 10).")
+    parser.add_argument("--sweep-unit", choices=("db", "linear"), default="db",
+                        help="Unit of --sweep-thresholds (default: db).")
+    parser.add_argument("--sweep-window-ms", type=int, choices=PYRAMID_LEVELS_MS, default=1000,
+                        help="Window size the sweep detects silence at (default: 1000).")
+    parser.add_argument("--sweep-metric", choices=("max", "min", "rms"), default="max",
+                        help="Envelope compared with the threshold: window peak, quietest 10 ms peak "
+                             "or RMS (default: max).")
+    parser.add_argument("--dry-run", metavar="CUTS_FILE",
+                        help="Write the kept and removed ranges instead of rendering: .json, .edl (CMX 3600) "
+                             "or any other extension for an ffmpeg filter script.")
+    parser.add_argument("--cuts-from", metavar="CUTS_FILE",
+                        help="Apply a cut list written by --dry-run instead of detecting silence.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Encode kept ranges while detection is still running, with --jobs encoder threads; "
+                             "re-encodes, so it cannot be combined with --stream-copy.")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write per-stage wall time, CPU time, realtime factor and peak RSS as JSON.")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="Write a cProfile dump of the decode and detection stages.")
+    parser.add_argument("--batch", nargs="+", metavar="PATH",
+                        help="Directories or glob patterns of videos to process on a worker pool.")
+    parser.add_argument("--output-dir", help="Directory for the outputs of --batch.")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Number of files processed at once with --batch (default: 2).")
+    parser.add_argument("--manifest",
+                        help="Manifest that lets an interrupted batch resume (default: OUTPUT_DIR/manifest.json).")
     args = parser.parse_args()
+    if args.pipeline and args.stream_copy:
+        parser.error("--pipeline re-encodes every kept range and cannot be combined with --stream-copy.")
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.detector == "speech":
+        detector = SpeechDetector(args.speech_threshold, args.min_silence_duration)
+    else:
+        detector = WindowDetector(args.silence_threshold, args.min_silence_duration,
+                                  window_ms=args.window_ms, hop_ms=args.hop_ms)
+    options = dict(stream_copy=args.stream_copy,
+                   jobs=args.jobs or os.cpu_count(),
+                   cache_dir=cache_dir,
+                   cache_size=args.cache_size,
+                   pipeline=args.pipeline,
+                   codec="libx264")
 
-    remove_silence(args.input_file, args.output_file, 
-                   silence_threshold=args.silence_threshold, 
-                   min_silence_duration=args.min_silence_duration)
+    if args.batch:
+        if args.dry_run or args.cuts_from:
+            parser.error("--dry-run and --cuts-from apply to a single input_file.")
+        if not args.output_dir:
+            parser.error("--output-dir is required with --batch")
+        try:
+            failed = run_batch(args.batch, args.output_dir, detector, args.manifest, args.workers, **options)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(1 if failed else 0)
+    elif args.input_file is None:
+        parser.error("input_file is required unless --batch is given")
+    elif args.sweep:
+        sweep(args.input_file, args.sweep_thresholds, args.sweep_durations,
+              unit=args.sweep_unit, window_ms=args.sweep_window_ms, metric=args.sweep_metric,
+              cache_dir=cache_dir, cache_size=args.cache_size)
+    elif args.output_file is None and not args.dry_run:
+        parser.error("output_file is required unless --sweep, --batch or --dry-run is given")
+    else:
+        profiler = Profiler(args.cprofile)
+        try:
+            remove_silence(args.input_file, args.output_file, detector, profiler=profiler,
+                           cuts_from=args.cuts_from, dry_run=args.dry_run, **options)
+        finally:
+            profiler.close()
+        if args.profile:
+            with open(args.profile, "w") as f:
+                json.dump(dict(input_file=args.input_file, **profiler.report()), f, indent=2)
@@ -0,0 +1,1078 @@
+# Silence detection and cutting shared by video-silence-remover.py and
+# optimized-video-silence-remover.py. moviepy is only imported where a clip is rendered through
+# it, so the command line starts without loading it.
+import bisect
+import contextlib
+import cProfile
+import functools
+import glob
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+try:
+    import resource
+except ImportError:
+    resource = None
+import numpy as np
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_binary():
+    # moviepy.config costs more to import than the rest of startup, so it waits for the first ffmpeg call
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+
+def read_audio_array(input_file, fps, nchannels, duration, block_size=1 << 22):
+    # Stream the whole track through a single ffmpeg pipe into one preallocated float32 buffer
+    n_samples = int(np.ceil(duration * fps))
+    audio_array = np.empty((n_samples, nchannels), dtype=np.float32)
+    buffer = memoryview(audio_array).cast("B")
+
+    cmd = [ffmpeg_binary(), "-v", "error", "-i", input_file, "-vn",
+           "-f", "f32le", "-acodec", "pcm_f32le", "-ar", str(fps), "-ac", str(nchannels), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    filled = 0
+    while filled < len(buffer):
+        n = proc.stdout.readinto(buffer[filled:filled + block_size])
+        if not n:
+            break
+        filled += n
+
+    # Anything past the reported duration is dropped; ffmpeg exits on the closed pipe
+    truncated = filled == len(buffer)
+    proc.stdout.close()
+    errors = proc.stderr.read().decode(errors="replace")
+    proc.wait()
+    if proc.returncode != 0 and not truncated:
+        raise IOError(f"ffmpeg failed to decode audio from {input_file}: {errors.strip()}")
+
+    return audio_array[:filled // audio_array.itemsize // nchannels]
+
+def iter_pcm_blocks(input_file, fps, nchannels, block_samples, ffmpeg=None):
+    # Decode sequentially through one ffmpeg pipe, refilling the same float32 block each time. Callers
+    # with their own ffmpeg pass it, which also keeps moviepy out of their way
+    cmd = [ffmpeg or ffmpeg_binary(), "-v", "error", "-i", input_file, "-vn",
+           "-f", "f32le", "-acodec", "pcm_f32le", "-ar", str(fps), "-ac", str(nchannels), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    block = np.empty((block_samples, nchannels), dtype=np.float32)
+    buffer = memoryview(block).cast("B")
+    frame_bytes = block.itemsize * nchannels
+    try:
+        while True:
+            filled = 0
+            while filled < len(buffer):
+                n = proc.stdout.readinto(buffer[filled:])
+                if not n:
+                    break
+                filled += n
+            if filled >= frame_bytes:
+                yield block[:filled // frame_bytes]
+            if filled < len(buffer):
+                break
+    finally:
+        proc.stdout.close()
+        errors = proc.stderr.read().decode(errors="replace")
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg failed to decode audio from {input_file}: {errors.strip()}")
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".wma")
+
+def probe_media(input_file, ffmpeg=None):
+    # ffmpeg -i without an output lists the streams and exits with an error, which is expected here
+    cmd = [ffmpeg or ffmpeg_binary(), "-hide_banner", "-i", input_file]
+    log = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode(errors="replace")
+
+    duration = re.search(r"Duration: (\d+):(\d+):([0-9.]+)", log)
+    audio = re.search(r"Stream #\S+.*?: Audio: .*?(\d+) Hz, ([^,\n]+)", log)
+    if duration is None or audio is None:
+        raise IOError(f"No audio stream found in {input_file}")
+    hours, minutes, seconds = duration.groups()
+    # Cover art in audio files is listed as a video stream too; anything but mono is mixed
+    # to stereo, as moviepy does
+    video = [line for line in re.findall(r"Stream #\S+.*?: Video: .*", log) if "(attached pic)" not in line]
+    frame_rate = re.search(r", ([0-9.]+) fps", video[0]) if video else None
+    return {"duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+            "fps": int(audio.group(1)),
+            "nchannels": 1 if audio.group(2).strip() == "mono" else 2,
+            "video": bool(video),
+            "frame_rate": float(frame_rate.group(1)) if frame_rate else None}
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "silence-remover")
+
+def content_key(input_file, *params, sample_size=1 << 20):
+    # The size and the first, middle and last MiB identify the file without reading all of it
+    size = os.path.getsize(input_file)
+    digest = hashlib.blake2b(repr((size,) + params).encode(), digest_size=16)
+    with open(input_file, "rb") as f:
+        for offset in (0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+def load_envelope(cache_dir, key):
+    path = os.path.join(cache_dir, key + ".npz")
+    try:
+        with np.load(path) as data:
+            envelope = {name: data[name] for name in data.files}
+    except (OSError, ValueError):
+        return None
+    # The modification time doubles as the last-used time for eviction
+    os.utime(path)
+    return envelope
+
+def save_envelope(cache_dir, key, max_bytes, **arrays):
+    if sum(array.nbytes for array in arrays.values()) > max_bytes:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".npz")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    evict_envelopes(cache_dir, max_bytes)
+
+def evict_envelopes(cache_dir, max_bytes):
+    # Drop the least recently used entries until the directory fits in max_bytes
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npz"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def silent_runs(silent):
+    # Runs of equal values are delimited by the edges of the mask; silent runs alternate
+    # with loud ones, starting with the first run if the audio begins silent
+    if len(silent) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    edges = np.flatnonzero(silent[1:] != silent[:-1]) + 1
+    bounds = np.concatenate(([0], edges, [len(silent)]))
+    first = 0 if silent[0] else 1
+    return bounds[:-1][first::2], bounds[1:][first::2]
+
+def iter_silence_events(silent_blocks, min_length):
+    # Streams silent runs across consecutive blocks of a silence mask: yields ("start", i) as soon
+    # as a run has lasted min_length and ("end", j) when that run closes
+    offset = 0
+    run_start, confirmed = None, False
+    for silent in silent_blocks:
+        n = len(silent)
+        starts, ends = silent_runs(silent)
+        runs = list(zip((starts + offset).tolist(), (ends + offset).tolist()))
+
+        # A run left open by the previous block either continues here or ended with it
+        if run_start is not None:
+            if runs and runs[0][0] == offset:
+                runs[0] = (run_start, runs[0][1])
+            else:
+                if confirmed:
+                    yield "end", offset
+                run_start, confirmed = None, False
+
+        for start, end in runs:
+            if start != run_start:
+                confirmed = False
+            if not confirmed and end - start >= min_length:
+                yield "start", start
+                confirmed = True
+            if end == offset + n:
+                run_start = start
+            else:
+                if confirmed:
+                    yield "end", end
+                run_start, confirmed = None, False
+        offset += n
+
+    if run_start is not None and confirmed:
+        yield "end", offset
+
+def loudness_envelope(audio_array):
+    # Per-sample peak across channels; the per-channel maximum avoids materializing
+    # np.abs() of the whole 2-D array
+    peak = np.abs(audio_array[:, 0])
+    for channel in range(1, audio_array.shape[1]):
+        np.maximum(peak, np.abs(audio_array[:, channel]), out=peak)
+    return peak
+
+def detect_silence(audio_array, threshold=0.01, min_silence_duration=10, fps=None):
+    return detect_silence_envelope(loudness_envelope(audio_array), threshold, min_silence_duration, fps)
+
+def detect_silence_envelope(peak, threshold=0.01, min_silence_duration=10, fps=None):
+    # With fps the minimum duration and the returned ranges are in seconds; without it they
+    # are a sample count and fractions of the envelope length
+    silent = peak < threshold
+    if len(silent) == 0:
+        return []
+    starts, ends = silent_runs(silent)
+
+    if fps:
+        min_samples, scale = min_silence_duration * fps, fps
+    else:
+        min_samples, scale = min_silence_duration, len(silent)
+
+    keep = (ends - starts) >= min_samples
+    starts = starts[keep] / scale
+    ends = ends[keep] / scale
+
+    return list(zip(starts.tolist(), ends.tolist()))
+
+# Samples per window of the envelope SampleDetector caches. Besides its loudest sample, each window keeps
+# the samples louder than every one before them, and than every one after them: for any threshold the
+# first of those at or above it is where the leading silence of the window ends, or the trailing one
+# starts. That keeps silences of a window or longer sample-accurate at a fraction of the per-sample size
+ENVELOPE_WINDOW = 1024
+
+def running_max_records(windows):
+    # Offsets and values where the running maximum along each row rises, and how many there are per row
+    running = np.maximum.accumulate(windows, axis=1)
+    rises = np.empty(windows.shape, dtype=bool)
+    rises[:, 0] = True
+    np.greater(running[:, 1:], running[:, :-1], out=rises[:, 1:])
+    rows, offsets = np.nonzero(rises)
+    return offsets.astype(np.uint16), windows[rows, offsets], np.count_nonzero(rises, axis=1).astype(np.uint16)
+
+def sample_window_envelope(peak, window=ENVELOPE_WINDOW, chunk=1 << 12):
+    # Worked through chunk windows at a time; zero padding completes the last window without adding
+    # anything at or above a threshold
+    envelope = {"length": np.array(len(peak))}
+    highs, forward, backward = [], [], []
+    for start in range(0, len(peak), chunk * window):
+        block = peak[start:start + chunk * window]
+        if len(block) % window:
+            block = np.concatenate((block, np.zeros(window - len(block) % window, dtype=block.dtype)))
+        windows = block.reshape(-1, window)
+        highs.append(windows.max(axis=1))
+        forward.append(running_max_records(windows))
+        backward.append(running_max_records(windows[:, ::-1]))
+    if highs:
+        envelope["highs"] = np.concatenate(highs)
+        for name, records in (("forward", forward), ("backward", backward)):
+            for field, parts in zip(("offset", "peak", "count"), zip(*records)):
+                envelope[f"{name}_{field}"] = np.concatenate(parts)
+    return envelope
+
+def first_record_above(offsets, peaks, counts, threshold, window):
+    # Per window, the offset of its first record at or above threshold, or window if it has none;
+    # every window has at least one record, its first sample
+    return np.minimum.reduceat(np.where(peaks >= threshold, offsets, window).astype(np.int64),
+                               np.cumsum(counts, dtype=np.int64) - counts)
+
+def detect_silence_windowed(envelope, threshold=0.01, min_silence_duration=10, fps=None, window=ENVELOPE_WINDOW):
+    # Silent ranges in seconds from a window envelope. A silence of at least one window covers whole
+    # windows or crosses a window boundary, so it is the trailing silence of one window, the windows
+    # silent throughout and the leading silence of the next; shorter ones are missed
+    length = int(envelope["length"])
+    if not length:
+        return []
+    silent = envelope["highs"] < threshold
+    n = len(silent)
+    leading = first_record_above(envelope["forward_offset"], envelope["forward_peak"], envelope["forward_count"],
+                                 threshold, window)
+    trailing = first_record_above(envelope["backward_offset"], envelope["backward_peak"],
+                                  envelope["backward_count"], threshold, window)
+
+    # Runs of silent windows, and the boundaries with a window that is not silent on both sides
+    firsts, lasts = silent_runs(silent)
+    padded = np.concatenate(([False], silent, [False]))
+    boundaries = np.flatnonzero(~padded[:-1] & ~padded[1:])
+    firsts, lasts = np.concatenate((firsts, boundaries)), np.concatenate((lasts, boundaries))
+
+    # The padding of the last window counts towards its trailing silence, which ends at length
+    starts = firsts * window - np.where(firsts > 0, trailing[np.maximum(firsts - 1, 0)], 0)
+    ends = np.minimum(lasts * window + np.where(lasts < n, leading[np.minimum(lasts, n - 1)], 0), length)
+    keep = (ends - starts) >= min_silence_duration * fps
+    starts, ends = np.sort(starts[keep]), np.sort(ends[keep])
+    return list(zip((starts / fps).tolist(), (ends / fps).tolist()))
+
+# Raw formats for the out-of-core scratch file and the full-scale value of each
+SCRATCH_FORMATS = {"float32": ("f32le", "pcm_f32le", 1.0), "int16": ("s16le", "pcm_s16le", 32768.0)}
+
+def decode_to_scratch(input_file, fps, nchannels, workdir, dtype="float32"):
+    # ffmpeg writes the raw PCM straight to disk, so the decode holds nothing in memory
+    fmt, codec, _ = SCRATCH_FORMATS[dtype]
+    path = os.path.join(workdir, "audio." + fmt)
+    cmd = [ffmpeg_binary(), "-v", "error", "-y", "-i", input_file, "-vn",
+           "-f", fmt, "-acodec", codec, "-ar", str(fps), "-ac", str(nchannels), path]
+    result = subprocess.run(cmd, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        errors = result.stderr.decode(errors="replace").strip()
+        raise IOError(f"ffmpeg failed to decode audio from {input_file}: {errors}")
+    return path
+
+def detect_silence_scratch(path, nchannels, fps, threshold=0.01, min_silence_duration=10, dtype="float32",
+                           block_samples=1 << 20):
+    # Maps one block of the scratch file at a time, so memory does not grow with the input
+    full_scale = SCRATCH_FORMATS[dtype][2]
+    frame_bytes = np.dtype(dtype).itemsize * nchannels
+    n_samples = os.path.getsize(path) // frame_bytes
+
+    def silent_blocks():
+        for offset in range(0, n_samples, block_samples):
+            n = min(block_samples, n_samples - offset)
+            block = np.memmap(path, dtype=dtype, mode="r", offset=offset * frame_bytes, shape=(n, nchannels))
+            if full_scale != 1.0:
+                block = block.astype(np.float32) / full_scale
+            yield loudness_envelope(block) < threshold
+
+    silent_ranges = []
+    for kind, sample in iter_silence_events(silent_blocks(), min_silence_duration * fps):
+        if kind == "start":
+            start = sample
+        else:
+            silent_ranges.append((start / fps, sample / fps))
+    return silent_ranges
+
+def window_loudness(frames):
+    # One reduction over the window axis of a (windows, samples) view, without copying the frames
+    peaks = np.maximum(frames.max(axis=1), -frames.min(axis=1))
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frames.shape[1])
+    return peaks, rms
+
+def window_samples(fps, window_ms, hop_ms=None):
+    # Window and hop rounded to whole samples. Window times must be derived from these counts rather
+    # than from the ms values, which drift from them at rates like 22050 Hz
+    window = max(1, int(round(window_ms * fps / 1000.0)))
+    hop = max(1, int(round((hop_ms or window_ms) * fps / 1000.0)))
+    return window, hop
+
+def iter_loudness(input_file, fps, nchannels, window_ms=1000, hop_ms=None, windows_per_block=None):
+    # Single pass over the decoded audio, yielding peak and RMS arrays block by block. Windows are
+    # strided views into one buffer holding a block of new samples plus the tail of the previous
+    # block that later windows still overlap
+    window, hop = window_samples(fps, window_ms, hop_ms)
+    windows_per_block = windows_per_block or max(16, -(-fps // hop))
+    block_samples = windows_per_block * hop
+
+    buffer = np.empty((window + block_samples, nchannels), dtype=np.float32)
+    flat = buffer.reshape(-1)
+    carry = skip = 0
+
+    for block in iter_pcm_blocks(input_file, fps, nchannels, block_samples):
+        # With a hop longer than the window, the samples between windows are never measured
+        if skip:
+            dropped = min(skip, len(block))
+            block, skip = block[dropped:], skip - dropped
+        total = carry + len(block)
+        buffer[carry:total] = block
+        n_full = (total - window) // hop + 1 if total >= window else 0
+        if n_full:
+            frames = np.lib.stride_tricks.sliding_window_view(flat[:total * nchannels], window * nchannels)
+            yield window_loudness(frames[::hop * nchannels][:n_full])
+        next_start = n_full * hop
+        carry, skip = max(total - next_start, 0), max(next_start - total, 0)
+        buffer[:carry] = buffer[next_start:next_start + carry]
+
+    # Windows that start before the end of the audio but run past it are reduced over what is left
+    for start in range(0, carry, hop):
+        yield window_loudness(flat[start * nchannels:carry * nchannels].reshape(1, -1))
+
+def scan_loudness(input_file, fps, nchannels, window_ms=1000, hop_ms=None, windows_per_block=None):
+    peaks, rms = [], []
+    for block_peaks, block_rms in iter_loudness(input_file, fps, nchannels, window_ms, hop_ms, windows_per_block):
+        peaks.append(block_peaks)
+        rms.append(block_rms)
+
+    if not peaks:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    return np.concatenate(peaks), np.concatenate(rms)
+
+def cached_loudness(input_file, fps, nchannels, window_ms, hop_ms=None, cache_dir=None, cache_size=1024,
+                    windows_per_block=None):
+    hop_ms = hop_ms or window_ms
+    key = content_key(input_file, "ms", fps, window_ms, hop_ms)
+    envelope = load_envelope(cache_dir, key) if cache_dir else None
+    if envelope is not None:
+        print("Using cached loudness envelope")
+        return envelope["peak"], envelope["rms"]
+
+    peaks, rms = scan_loudness(input_file, fps, nchannels, window_ms=window_ms, hop_ms=hop_ms,
+                               windows_per_block=windows_per_block)
+    if cache_dir:
+        save_envelope(cache_dir, key, cache_size * 1024 * 1024, peak=peaks, rms=rms)
+    return peaks, rms
+
+def detect_silence_windows(peaks, window_seconds, duration, silence_threshold=-50.0, min_silence_duration=10,
+                           hop_seconds=None):
+    # window_seconds and hop_seconds are the whole-sample window and hop divided by the sample rate
+    silent = peaks < (10 ** (silence_threshold / 20))
+    if len(silent) == 0:
+        return []
+
+    # Window i covers [i * hop, i * hop + window)
+    hop_seconds = hop_seconds or window_seconds
+    starts, ends = silent_runs(silent)
+    starts = starts * hop_seconds
+    ends = np.minimum((ends - 1) * hop_seconds + window_seconds, duration)
+
+    keep = (ends - starts) >= min_silence_duration
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+# Telephone speech band in Hz
+SPEECH_BAND_HZ = (300, 3400)
+
+def band_levels(frames, fps, band=SPEECH_BAND_HZ):
+    # RMS inside the band of every row of a (frames, samples) array, from one batched real FFT;
+    # Parseval over the one-sided spectrum, corrected for the Hann window's energy
+    n = frames.shape[1]
+    window = np.hanning(n).astype(np.float32)
+    low, high = np.searchsorted(np.fft.rfftfreq(n, 1.0 / fps), band)
+    spectrum = np.fft.rfft(frames * window, axis=1)[:, low:high]
+    power = np.einsum("ij,ij->i", spectrum.real, spectrum.real) + np.einsum("ij,ij->i", spectrum.imag, spectrum.imag)
+    return np.sqrt(2 * power / (n * np.dot(window, window))).astype(np.float32)
+
+def iter_band_levels(input_file, fps, frame_ms, band=SPEECH_BAND_HZ, frames_per_block=2048):
+    # ffmpeg resamples and mixes down to mono, so the FFT only sees the rate the band needs;
+    # back-to-back frames, the last one zero-padded
+    frame = window_samples(fps, frame_ms)[0]
+    for block in iter_pcm_blocks(input_file, fps, 1, frame * frames_per_block):
+        samples = block[:, 0]
+        if len(samples) % frame:
+            samples = np.concatenate((samples, np.zeros(frame - len(samples) % frame, dtype=np.float32)))
+        yield band_levels(samples.reshape(-1, frame), fps, band)
+
+class SampleDetector(object):
+    # Silence is every sample whose peak across channels is below a linear amplitude threshold
+    def __init__(self, threshold=0.01, min_silence_duration=10, out_of_core=False, scratch_dir=None,
+                 scratch_dtype="float32"):
+        self.threshold = threshold
+        self.min_silence_duration = min_silence_duration
+        self.out_of_core = out_of_core
+        self.scratch_dir = scratch_dir
+        self.scratch_dtype = scratch_dtype
+
+    def detect(self, input_file, media, cache_dir=None, cache_size=1024, profiler=None):
+        profiler = profiler or Profiler()
+        fps, nchannels = media["fps"], media["nchannels"]
+        if self.out_of_core:
+            # Decode once to a scratch file and scan it block by block; the envelope cache is
+            # bypassed because loading a cached envelope would hold it in memory
+            with tempfile.TemporaryDirectory(dir=self.scratch_dir) as workdir:
+                with profiler.stage("decode"):
+                    print("Decoding audio data to a scratch file...")
+                    scratch = decode_to_scratch(input_file, fps, nchannels, workdir, self.scratch_dtype)
+                with profiler.stage("detect"):
+                    return detect_silence_scratch(scratch, nchannels, fps, self.threshold, self.min_silence_duration,
+                                                  dtype=self.scratch_dtype)
+
+        # The window envelope does not depend on the threshold, so reruns skip the decode; it misses
+        # silences shorter than a window, so a minimum that short decodes again
+        key = content_key(input_file, "sample-windows", fps, ENVELOPE_WINDOW)
+        cached = cache_dir and self.min_silence_duration * fps >= ENVELOPE_WINDOW
+        with profiler.stage("decode"):
+            envelope = load_envelope(cache_dir, key) if cached else None
+            if envelope is not None:
+                print("Using cached loudness envelope")
+            else:
+                print("Decoding audio data...")
+                audio_array = read_audio_array(input_file, fps, nchannels, media["duration"])
+                print(f"Audio array shape: {audio_array.shape}")
+
+        with profiler.stage("detect"):
+            if envelope is not None:
+                return detect_silence_windowed(envelope, self.threshold, self.min_silence_duration, fps=fps)
+            peak = loudness_envelope(audio_array)
+            del audio_array
+            silent_ranges = detect_silence_envelope(peak, self.threshold, self.min_silence_duration, fps=fps)
+
+        if cache_dir:
+            save_envelope(cache_dir, key, cache_size * 1024 * 1024, **sample_window_envelope(peak))
+        return silent_ranges
+
+    def iter_keep_ranges(self, input_file, media):
+        # Keep ranges in seconds, each released once the silence that ends it has lasted long enough;
+        # one-second blocks keep that delay short
+        fps, duration = media["fps"], media["duration"]
+        silent_blocks = (loudness_envelope(block) < self.threshold
+                         for block in iter_pcm_blocks(input_file, fps, media["nchannels"], fps))
+        keep_start = 0.0
+        for kind, sample in iter_silence_events(silent_blocks, self.min_silence_duration * fps):
+            if kind == "start":
+                if sample / fps > keep_start:
+                    yield keep_start, sample / fps
+            else:
+                keep_start = sample / fps
+        if keep_start < duration:
+            yield keep_start, duration
+
+class WindowDetector(object):
+    # Silence is every window of window_ms, one every hop_ms, whose peak is below a threshold in dBFS
+    def __init__(self, threshold=-50.0, min_silence_duration=10, window_ms=1000, hop_ms=None):
+        self.threshold = threshold
+        self.min_silence_duration = min_silence_duration
+        self.window_ms = window_ms
+        self.hop_ms = hop_ms or window_ms
+
+    def levels(self, input_file, media, cache_dir=None, cache_size=1024):
+        # Linear level of every window, compared against the threshold
+        peaks, _ = cached_loudness(input_file, media["fps"], media["nchannels"], self.window_ms, self.hop_ms,
+                                   cache_dir=cache_dir, cache_size=cache_size)
+        return peaks
+
+    def iter_levels(self, input_file, media):
+        for peaks, _ in iter_loudness(input_file, media["fps"], media["nchannels"], self.window_ms, self.hop_ms):
+            yield peaks
+
+    def window_seconds(self, media):
+        # Window and hop in seconds, as the levels were measured
+        window, hop = window_samples(media["fps"], self.window_ms, self.hop_ms)
+        return window / media["fps"], hop / media["fps"]
+
+    def detect(self, input_file, media, cache_dir=None, cache_size=1024, profiler=None):
+        profiler = profiler or Profiler()
+        with profiler.stage("decode"):
+            levels = self.levels(input_file, media, cache_dir, cache_size)
+        with profiler.stage("detect"):
+            window, hop = self.window_seconds(media)
+            return detect_silence_windows(levels, window, media["duration"], self.threshold,
+                                          self.min_silence_duration, hop)
+
+    def iter_keep_ranges(self, input_file, media):
+        # Keep ranges in seconds, each released once the silence that ends it has lasted long enough
+        (window, hop), duration = self.window_seconds(media), media["duration"]
+        linear = 10 ** (self.threshold / 20)
+        silent_blocks = (levels < linear for levels in self.iter_levels(input_file, media))
+        # A run of n windows spans (n - 1) * hop + window
+        min_windows = max(1, math.ceil((self.min_silence_duration - window) / hop) + 1)
+
+        keep_start = 0.0
+        for kind, index in iter_silence_events(silent_blocks, min_windows):
+            if kind == "start":
+                if index * hop > keep_start:
+                    yield keep_start, index * hop
+            else:
+                keep_start = min((index - 1) * hop + window, duration)
+        if keep_start < duration:
+            yield keep_start, duration
+
+class SpeechDetector(WindowDetector):
+    # Silence is every frame whose energy inside the speech band is below a threshold in dBFS, so
+    # mains hum and ventilation rumble below the band do not count as sound
+    def __init__(self, threshold=-45.0, min_silence_duration=10, frame_ms=32, band=SPEECH_BAND_HZ,
+                 sample_rate=16000):
+        super(SpeechDetector, self).__init__(threshold, min_silence_duration, window_ms=frame_ms)
+        self.band = tuple(band)
+        self.sample_rate = sample_rate
+
+    def levels(self, input_file, media, cache_dir=None, cache_size=1024):
+        key = content_key(input_file, "speech", self.sample_rate, self.window_ms, *self.band)
+        envelope = load_envelope(cache_dir, key) if cache_dir else None
+        if envelope is not None:
+            print("Using cached speech-band envelope")
+            return envelope["rms"]
+
+        blocks = list(self.iter_levels(input_file, media))
+        levels = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+        if cache_dir:
+            save_envelope(cache_dir, key, cache_size * 1024 * 1024, rms=levels)
+        return levels
+
+    def iter_levels(self, input_file, media):
+        return iter_band_levels(input_file, self.sample_rate, self.window_ms, self.band)
+
+    def window_seconds(self, media):
+        # Frames are counted at the resampled rate, back to back
+        frame = window_samples(self.sample_rate, self.window_ms)[0]
+        return frame / self.sample_rate, frame / self.sample_rate
+
+# Every detector takes the input file and its probe_media() description and returns silent ranges
+# in seconds from detect(), or kept ranges as they are found from iter_keep_ranges()
+DETECTORS = {"sample": SampleDetector, "window": WindowDetector, "speech": SpeechDetector}
+
+def keep_ranges(silent_ranges, duration):
+    keep = []
+    last_end = 0
+
+    for start, end in silent_ranges:
+        if start > last_end:
+            keep.append((last_end, start))
+        last_end = end
+
+    if last_end < duration:
+        keep.append((last_end, duration))
+    return keep
+
+# Timecode rate used in the EDLs of audio-only inputs
+AUDIO_FRAME_RATE = 25
+
+# Cut lists are written and read in the format named by their extension; anything that is not
+# .json or .edl is an ffmpeg filter script
+def cut_format(path):
+    return {".json": "json", ".edl": "edl"}.get(os.path.splitext(path)[1].lower(), "ffmpeg")
+
+def timecode(seconds, frame_rate):
+    # Non-drop-frame timecode; fractional rates count frames at the nominal rate
+    rate = int(round(frame_rate))
+    frames = int(round(seconds * frame_rate))
+    return (f"{frames // (3600 * rate):02d}:{frames // (60 * rate) % 60:02d}:"
+            f"{frames // rate % 60:02d}:{frames % rate:02d}")
+
+def parse_timecode(value, frame_rate):
+    hours, minutes, seconds, frames = (int(part) for part in re.split(r"[:;]", value))
+    return (((hours * 60 + minutes) * 60 + seconds) * int(round(frame_rate)) + frames) / frame_rate
+
+def write_cut_list(path, keep, duration, frame_rate, input_file, has_video=True):
+    fmt = cut_format(path)
+    with open(path, "w") as f:
+        if fmt == "json":
+            json.dump({"source": os.path.abspath(input_file), "duration": duration, "frame_rate": frame_rate,
+                       "keep": keep, "remove": keep_ranges(keep, duration)}, f, indent=2)
+        elif fmt == "edl":
+            # CMX 3600: one cut event per kept range, recorded back to back
+            f.write(f"TITLE: {os.path.splitext(os.path.basename(input_file))[0]}\nFCM: NON-DROP FRAME\n\n")
+            record = 0.0
+            for event, (start, end) in enumerate(keep, 1):
+                f.write(f"{event:03d}  AX       {'AA/V' if has_video else 'AA':<5} C        "
+                        f"{timecode(start, frame_rate)} {timecode(end, frame_rate)} "
+                        f"{timecode(record, frame_rate)} {timecode(record + end - start, frame_rate)}\n"
+                        f"* FROM CLIP NAME: {os.path.basename(input_file)}\n\n")
+                record += end - start
+        else:
+            # For ffmpeg -filter_complex_script, mapping [v] and [a] to the output
+            between = "+".join(f"between(t,{start:.6f},{end:.6f})" for start, end in keep)
+            filters = [f"[0:a]aselect='{between}',asetpts=N/SR/TB[a]"]
+            if has_video:
+                filters.insert(0, f"[0:v]select='{between}',setpts=N/FRAME_RATE/TB[v]")
+            f.write(";\n".join(filters) + "\n")
+    print(f"Wrote {len(keep)} kept ranges to {path}")
+
+def read_cut_list(path, frame_rate):
+    # frame_rate converts EDL timecodes, which carry no rate of their own
+    fmt = cut_format(path)
+    with open(path) as f:
+        if fmt == "json":
+            return [(start, end) for start, end in json.load(f)["keep"]]
+        text = f.read()
+    if fmt == "edl":
+        tc = r"(\d\d[:;]\d\d[:;]\d\d[:;]\d\d)"
+        events = re.findall(rf"^\d+\s+\S+\s+\S+\s+C\s+{tc}\s+{tc}\s+{tc}\s+{tc}", text, re.MULTILINE)
+        return [(parse_timecode(start, frame_rate), parse_timecode(end, frame_rate)) for start, end, _, _ in events]
+    # Every select in the script lists the same ranges, so only the first is read
+    first = text.split(";")[0]
+    return [(float(start), float(end)) for start, end in re.findall(r"between\(t,([0-9.]+),([0-9.]+)\)", first)]
+
+# Encoders used to re-encode the partial GOP at a cut that does not land on a keyframe
+STREAM_COPY_ENCODERS = {"h264": "libx264", "hevc": "libx265", "mpeg4": "mpeg4", "vp9": "libvpx-vp9"}
+
+def probe_keyframes(input_file):
+    # Only keyframes are decoded; showinfo logs each one's timestamp and the banner names the codec
+    cmd = [ffmpeg_binary(), "-hide_banner", "-skip_frame", "nokey", "-i", input_file,
+           "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-"]
+    log = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr.decode(errors="replace")
+
+    codec = re.search(r"Stream #\S+.*?: Video: (\w+)", log)
+    if codec is None:
+        raise IOError(f"No video stream found in {input_file}")
+    keyframes = sorted(float(t) for t in re.findall(r"pts_time:\s*(-?[0-9.]+)", log))
+    return codec.group(1), keyframes
+
+def write_piece(input_file, piece_file, start, end, video_codec):
+    cmd = [ffmpeg_binary(), "-v", "error", "-y", "-ss", f"{start:.6f}", "-i", input_file,
+           "-t", f"{end - start:.6f}", "-map", "0:v:0", "-map", "0:a?",
+           "-c:v", video_codec, "-c:a", "aac", "-avoid_negative_ts", "make_zero", piece_file]
+    subprocess.run(cmd, check=True)
+
+def concat_pieces(pieces, output_file, workdir):
+    list_file = os.path.join(workdir, "concat.txt")
+    with open(list_file, "w") as f:
+        for piece in pieces:
+            escaped = piece.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [ffmpeg_binary(), "-v", "error", "-y", "-f", "concat", "-safe", "0",
+           "-i", list_file, "-map", "0", "-c", "copy", output_file]
+    subprocess.run(cmd, check=True)
+
+def stream_copy_cut(input_file, output_file, keep, tolerance=1e-3):
+    codec, keyframes = probe_keyframes(input_file)
+    if codec not in STREAM_COPY_ENCODERS:
+        raise ValueError(f"Stream copy does not support {codec} video")
+    extension = os.path.splitext(output_file)[1] or ".mp4"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pieces = []
+        for start, end in keep:
+            # Copy from the first keyframe inside the range; only the GOP tail before it is re-encoded
+            i = bisect.bisect_left(keyframes, start - tolerance)
+            key = min(keyframes[i], end) if i < len(keyframes) else end
+            if key - start > tolerance:
+                pieces.append(os.path.join(workdir, f"{len(pieces):05d}{extension}"))
+                write_piece(input_file, pieces[-1], start, key, STREAM_COPY_ENCODERS[codec])
+            if end - key > tolerance:
+                pieces.append(os.path.join(workdir, f"{len(pieces):05d}{extension}"))
+                write_piece(input_file, pieces[-1], key, end, "copy")
+
+        print(f"Joining {len(pieces)} pieces with the concat demuxer")
+        concat_pieces(pieces, output_file, workdir)
+
+def write_audio_ranges(input_file, output_file, keep, fps, nchannels, block_samples=1 << 20):
+    # Decoded blocks are sliced against the kept ranges and piped straight into the encoder, which
+    # picks the codec from the output extension; only one block is held in memory
+    cmd = [ffmpeg_binary(), "-v", "error", "-y", "-f", "f32le", "-ar", str(fps),
+           "-ac", str(nchannels), "-i", "pipe:0", "-vn", output_file]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    bounds = np.round(np.array(keep, dtype=np.float64).reshape(-1, 2) * fps).astype(np.int64)
+
+    offset = 0
+    try:
+        for block in iter_pcm_blocks(input_file, fps, nchannels, block_samples):
+            end = offset + len(block)
+            for start, stop in bounds[(bounds[:, 1] > offset) & (bounds[:, 0] < end)]:
+                proc.stdin.write(block[max(start - offset, 0):min(stop, end) - offset].tobytes())
+            offset = end
+    finally:
+        proc.stdin.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg failed to encode {output_file}")
+
+def audio_stream_copy(input_file, output_file, keep):
+    # The concat demuxer reads every range from the source itself through inpoint/outpoint, so
+    # packets are copied in one pass; cuts land on the nearest packet boundary
+    escaped = os.path.abspath(input_file).replace("'", "'\\''")
+    with tempfile.TemporaryDirectory() as workdir:
+        list_file = os.path.join(workdir, "concat.txt")
+        with open(list_file, "w") as f:
+            for start, end in keep:
+                f.write(f"file '{escaped}'\ninpoint {start:.6f}\noutpoint {end:.6f}\n")
+
+        cmd = [ffmpeg_binary(), "-v", "error", "-y", "-f", "concat", "-safe", "0",
+               "-i", list_file, "-map", "0:a", "-c", "copy", output_file]
+        subprocess.run(cmd, check=True)
+
+def balanced_groups(ranges, n_groups):
+    # Split the ranges into n contiguous groups of equal total duration, cutting a range in two
+    # where a group boundary falls inside it, so the encoded groups can be joined in order
+    total = sum(end - start for start, end in ranges)
+    target = total / n_groups
+    groups = [[]]
+    filled = 0.0
+
+    for start, end in ranges:
+        while len(groups) < n_groups and filled + (end - start) > target * len(groups):
+            split = start + target * len(groups) - filled
+            if split - start > 1e-6:
+                groups[-1].append((start, split))
+            filled += split - start
+            start = split
+            groups.append([])
+        if end - start > 1e-6:
+            groups[-1].append((start, end))
+            filled += end - start
+
+    return [group for group in groups if group]
+
+def encode_group(input_file, ranges, piece_file, threads):
+    # Every worker uses the same codec settings so the pieces can be joined without re-encoding
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
+    started = time.perf_counter()
+    video = VideoFileClip(input_file)
+    clip = concatenate_videoclips([video.subclip(start, end) for start, end in ranges])
+    clip.write_videofile(piece_file, codec="libx264", audio_codec="aac", fps=video.fps,
+                         temp_audiofile=os.path.splitext(piece_file)[0] + "_audio.m4a",
+                         threads=threads, logger=None)
+    video.close()
+    return time.perf_counter() - started
+
+def parallel_encode(input_file, output_file, keep, jobs):
+    groups = balanced_groups(keep, jobs)
+    threads = max(1, (os.cpu_count() or 1) // len(groups))
+    extension = os.path.splitext(output_file)[1] or ".mp4"
+    print(f"Encoding {len(groups)} segments on {len(groups)} worker processes")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        pieces = [os.path.join(workdir, f"{i:05d}{extension}") for i in range(len(groups))]
+        with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+            worker_seconds = list(pool.map(encode_group, [input_file] * len(groups), groups,
+                                           pieces, [threads] * len(groups)))
+        concat_pieces(pieces, output_file, workdir)
+    elapsed = time.perf_counter() - started
+
+    # Busy time over wall time shows how well the workers were kept fed; it is not a measured speedup
+    print(f"Encoded in {elapsed:.1f} s; {sum(worker_seconds):.1f} s of encoding across workers, "
+          f"{sum(worker_seconds) / elapsed:.1f} workers busy on average")
+
+def pipeline_encode(input_file, output_file, keep_iter, jobs=1, queue_size=None):
+    # Detection runs in its own thread and queues every keep range as soon as it is final;
+    # encoder threads, each driving one ffmpeg process, work through the queue meanwhile
+    jobs = max(1, jobs)
+    work = queue.Queue(maxsize=queue_size or 2 * jobs)
+    extension = os.path.splitext(output_file)[1] or ".mp4"
+    pieces, errors = [], []
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        def detect():
+            try:
+                for start, end in keep_iter:
+                    pieces.append(os.path.join(workdir, f"{len(pieces):05d}{extension}"))
+                    work.put((pieces[-1], start, end))
+                print(f"Detection finished after {time.perf_counter() - started:.1f} s, "
+                      f"{len(pieces)} ranges queued")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                for _ in range(jobs):
+                    work.put(None)
+
+        def encode():
+            # After a failure the queue is still drained so the detector never blocks on it
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                if not errors:
+                    try:
+                        write_piece(input_file, item[0], item[1], item[2], "libx264")
+                    except Exception as e:
+                        errors.append(e)
+
+        threads = [threading.Thread(target=detect)] + [threading.Thread(target=encode) for _ in range(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        if not pieces:
+            print("No non-silent parts found. The entire video is silent.")
+            return
+        concat_pieces(pieces, output_file, workdir)
+    print(f"Pipeline finished in {time.perf_counter() - started:.1f} s")
+
+def peak_rss():
+    if resource is None:
+        return {}
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20,
+            "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20}
+
+class Profiler(object):
+    # Wall time, CPU time (including ffmpeg and worker processes once they have exited), realtime
+    # factor and peak RSS for each stage; the detection pass can also be recorded with cProfile
+    def __init__(self, cprofile_file=None):
+        self.stages = {}
+        self.media_seconds = None
+        self.cprofile_file = cprofile_file
+        self.cprofile = cProfile.Profile() if cprofile_file else None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        profiled = self.cprofile is not None and name in ("decode", "detect")
+        wall, cpu = time.perf_counter(), os.times()
+        if profiled:
+            self.cprofile.enable()
+        try:
+            yield
+        finally:
+            if profiled:
+                self.cprofile.disable()
+            end = os.times()
+            cpu_s = sum(end[:4]) - sum(cpu[:4])
+            self.stages[name] = dict(wall_s=time.perf_counter() - wall, cpu_s=cpu_s, **peak_rss())
+
+    def report(self):
+        for timing in self.stages.values():
+            timing["realtime_factor"] = self.media_seconds / timing["wall_s"] if timing["wall_s"] else None
+        return {"media_seconds": self.media_seconds, "stages": self.stages,
+                "total_wall_s": sum(timing["wall_s"] for timing in self.stages.values())}
+
+    def close(self):
+        # Called on every path, so the cProfile dump does not depend on a report being asked for
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.cprofile_file)
+
+def remove_silence(input_file, output_file, detector, stream_copy=False, jobs=1, cache_dir=DEFAULT_CACHE_DIR,
+                   cache_size=1024, profiler=None, pipeline=False, cuts_from=None, dry_run=None, codec=None):
+    profiler = profiler or Profiler()
+    media = probe_media(input_file)
+    profiler.media_seconds = media["duration"]
+    print(f"Duration: {media['duration']} seconds")
+    frame_rate = media["frame_rate"] or AUDIO_FRAME_RATE
+
+    if pipeline and stream_copy:
+        raise ValueError("The pipeline re-encodes every kept range and cannot stream copy")
+    if pipeline and media["video"] and not (cuts_from or dry_run):
+        # Encoding starts while the scan is still running, so wall time approaches the slower of the two
+        with profiler.stage("pipeline"):
+            pipeline_encode(input_file, output_file, detector.iter_keep_ranges(input_file, media), jobs)
+        return
+
+    if cuts_from:
+        # A saved cut list replaces detection, so each rendition of a source skips the decode
+        keep = read_cut_list(cuts_from, frame_rate)
+        print(f"Applying {len(keep)} kept ranges from {cuts_from}")
+    else:
+        silent_ranges = detector.detect(input_file, media, cache_dir, cache_size, profiler)
+        print(f"Detected {len(silent_ranges)} silent ranges")
+        keep = keep_ranges(silent_ranges, media["duration"])
+
+    if dry_run:
+        write_cut_list(dry_run, keep, media["duration"], frame_rate, input_file, media["video"])
+        return
+    if not keep:
+        print("No non-silent parts found. The entire file is silent.")
+        return
+
+    if not media["video"]:
+        # Audio-only inputs are cut on the decoded PCM and never go through moviepy
+        with profiler.stage("encode"):
+            if stream_copy:
+                audio_stream_copy(input_file, output_file, keep)
+            else:
+                write_audio_ranges(input_file, output_file, keep, media["fps"], media["nchannels"])
+        return
+    if stream_copy:
+        with profiler.stage("encode"):
+            stream_copy_cut(input_file, output_file, keep)
+        return
+    if jobs > 1:
+        with profiler.stage("encode"):
+            parallel_encode(input_file, output_file, keep, jobs)
+        return
+
+    # Only the single-process re-encode goes through moviepy, so it is imported here
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
+    video = VideoFileClip(input_file)
+    with profiler.stage("assemble"):
+        final_clip = concatenate_videoclips([video.subclip(start, end) for start, end in keep])
+    with profiler.stage("encode"):
+        final_clip.write_videofile(output_file, codec=codec)
+    video.close()
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".m4v", ".webm")
+
+def discover_inputs(patterns, output_dir):
+    # Directories are searched recursively and mirrored under output_dir; glob matches keep their name.
+    # Earlier outputs are not inputs, so anything under output_dir is left out
+    output_root = os.path.abspath(output_dir)
+
+    def is_output(path):
+        return os.path.commonpath([output_root, os.path.abspath(path)]) == output_root
+
+    files = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, names in os.walk(pattern):
+                dirs[:] = [name for name in dirs if not is_output(os.path.join(root, name))]
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    if name.lower().endswith(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS) and not is_output(path):
+                        files[os.path.abspath(path)] = os.path.join(output_dir, os.path.relpath(path, pattern))
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path) and not is_output(path):
+                    files[os.path.abspath(path)] = os.path.join(output_dir, os.path.basename(path))
+
+    # Inputs with the same name under different directories or patterns would overwrite each other
+    inputs_by_output = {}
+    for input_file, output_file in files.items():
+        inputs_by_output.setdefault(os.path.normcase(os.path.abspath(output_file)), []).append(input_file)
+    clashes = [inputs for inputs in inputs_by_output.values() if len(inputs) > 1]
+    if clashes:
+        raise ValueError("Inputs that would be written to the same output file: "
+                         + "; ".join(" and ".join(inputs) for inputs in clashes))
+    return files
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    # Written after every file, atomically, so an interrupted run can resume from it
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def batch_worker(input_file, output_file, detector, options):
+    started = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        remove_silence(input_file, output_file, detector, **options)
+    except Exception:
+        return "failed", traceback.format_exc(), time.perf_counter() - started
+    return "done", None, time.perf_counter() - started
+
+def batch_settings(detector, options):
+    # Stored in the manifest, through JSON so that tuples compare equal to the lists read back:
+    # changing any of them makes every entry stale
+    settings = {"detector": type(detector).__name__}
+    settings.update((name, value) for name, value in vars(detector).items()
+                    if name not in ("out_of_core", "scratch_dir"))
+    settings.update((name, options.get(name)) for name in ("stream_copy", "pipeline", "codec"))
+    return json.loads(json.dumps(settings))
+
+def run_batch(patterns, output_dir, detector, manifest_path=None, workers=2, **options):
+    # Outputs are kept as absolute paths, so a rerun from another directory or with the output
+    # directory spelled differently finds them
+    files = {input_file: os.path.abspath(output_file)
+             for input_file, output_file in discover_inputs(patterns, output_dir).items()}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, "manifest.json")
+    settings = batch_settings(detector, options)
+    manifest = load_manifest(manifest_path)
+    entries = manifest.get("files", {}) if manifest.get("settings") == settings else {}
+    manifest = {"settings": settings, "files": entries}
+
+    # Files finished by an earlier run with the same settings are skipped unless the source changed
+    # or the output is gone
+    pending = {}
+    for input_file, output_file in files.items():
+        stat = os.stat(input_file)
+        entry = entries.get(input_file)
+        if (entry and entry["status"] == "done" and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+                and entry["output"] == output_file and os.path.exists(output_file)):
+            continue
+        entries[input_file] = {"output": output_file, "status": "pending",
+                               "size": stat.st_size, "mtime": stat.st_mtime}
+        pending[input_file] = output_file
+    save_manifest(manifest_path, manifest)
+    print(f"{len(files) - len(pending)} of {len(files)} files already done, processing {len(pending)}")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(batch_worker, input_file, output_file, detector, options): input_file
+                   for input_file, output_file in pending.items()}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            try:
+                status, error, seconds = future.result()
+            except Exception as e:
+                # The worker process itself died; the file stays retryable on the next run
+                status, error, seconds = "failed", repr(e), None
+            entries[input_file].update(status=status, error=error, seconds=seconds)
+            save_manifest(manifest_path, manifest)
+            print(f"[{status}] {input_file}")
+            if error:
+                print(error)
+
+    failed = [path for path in files if entries[path]["status"] != "done"]
+    print(f"Batch finished: {len(files) - len(failed)} done, {len(failed)} failed")
+    return failed
@@ -129,6 +129,23 @@ shape_colors = [
     (128, 0, 128)   # Purple
 ]
 
+# Bitboard rows: bit x + WALL_PAD is column x. The bits below and above the 10 columns are set, so
+# the walls collide like locked blocks (Python ints extend the right wall indefinitely)
+WALL_PAD = 4
+EMPTY_ROW = ~(((1 << 10) - 1) << WALL_PAD)
+
+# Row masks of a rotation: (row in the shape format, bit j set for column j of that row)
+def shape_masks(format):
+    masks = []
+    for i, line in enumerate(format):
+        mask = sum(1 << j for j, column in enumerate(line) if column == '0')
+        if mask:
+            masks.append((i, mask))
+    return masks
+
+# Precomputed row masks of every rotation of every shape
+shape_rows = [[shape_masks(format) for format in shape] for shape in shapes]
+
 # Define the Piece class
 class Piece(object):
     def __init__(self, x, y, shape):
@@ -136,6 +153,7 @@ class Piece(object):
         self.y = y  # y position of the piece
         self.shape = shape  # Shape of the piece
         self.color = shape_colors[shapes.index(shape)]  # Color of the piece
+        self.masks = shape_rows[shapes.index(shape)]  # Row masks of each rotation
         self.rotation = 0  # Rotation state
 
 # Create the game grid
@@ -163,24 +181,55 @@ def convert_shape_format(shape):
     positions = [(x - 2, y - 4) for x, y in positions]
     return positions
 
-# Check if space is valid
-def valid_space(shape, grid):
-    accepted_positions = [[(x, y) for x in range(10) if grid[y][x] == (0,0,0)] for y in range(20)]
-    accepted_positions = [pos for sublist in accepted_positions for pos in sublist]
-
-    formatted = convert_shape_format(shape)
-
-    for pos in formatted:
-        if pos not in accepted_positions:
-            if pos[1] > -1:
+# Build the bitboard rows from the locked positions
+def board_rows(locked_positions):
+    rows = [EMPTY_ROW] * 20
+    for (x, y) in locked_positions:
+        if 0 <= y < 20 and 0 <= x < 10:
+            rows[y] |= 1 << (x + WALL_PAD)
+    return rows
+
+# The locked blocks, kept from frame to frame and changed only when a piece locks or rows clear
+class Board(object):
+    def __init__(self, locked_positions=None):
+        locked_positions = locked_positions or {}
+        self.grid = create_grid(locked_positions)  # Colors of the locked blocks
+        self.counts = [sum(color != (0,0,0) for color in row) for row in self.grid]  # Blocks in each row
+        self.rows = board_rows(locked_positions)  # Bitboard for valid_space
+
+# Add a locked piece to the board; blocks above the top are not kept
+def lock_piece(board, positions, color):
+    for x, y in positions:
+        if y > -1:
+            board.grid[y][x] = color
+            board.counts[y] += 1
+            board.rows[y] |= 1 << (x + WALL_PAD)
+
+# Check if space is valid: one AND per piece row against the bitboard. Cells above the board are
+# always allowed and cells below it never are
+def valid_space(shape, rows):
+    shift = shape.x - 2 + WALL_PAD
+    for i, mask in shape.masks[shape.rotation % len(shape.masks)]:
+        y = shape.y + i - 4
+        if y < 0:
+            continue
+        if y >= 20:
+            return False
+        if shift >= 0:
+            if (mask << shift) & rows[y]:
                 return False
+        # Further left than the padding; the missing low bits are wall too
+        elif mask & ((rows[y] << -shift) | ((1 << -shift) - 1)):
+            return False
     return True
 
-# Check if the game is lost
-def check_lost(positions):
+# Check if the game is lost: the piece just locked stuck out above the board, or blocks reached the top row
+def check_lost(board, positions):
+    if board.counts[0] > 0:
+        return True
     for pos in positions:
         x, y = pos
-        if y < 1:
+        if y < 0:
             return True
     return False
 
@@ -200,27 +249,14 @@ def draw_grid(surface, grid):
             # Vertical lines
             pygame.draw.line(surface, (128,128,128), (sx + j*block_size, sy), (sx + j*block_size, sy + play_height))
 
-# Clear full rows
-def clear_rows(grid, locked):
-    inc = 0  # Number of rows to clear
-    for i in range(len(grid)-1, -1, -1):
-        row = grid[i]
-        if (0,0,0) not in row:
-            inc += 1
-            # Remove the locked blocks in the row
-            for j in range(len(row)):
-                try:
-                    del locked[(j, i)]
-                except:
-                    continue
-
+# Clear full rows: the row counts say which rows are full, and the other rows move down as whole rows
+def clear_rows(board):
+    kept = [y for y in range(20) if board.counts[y] < 10]
+    inc = 20 - len(kept)  # Number of rows to clear
     if inc > 0:
-        # Move blocks above down
-        for key in sorted(list(locked), key=lambda x: x[1])[::-1]:
-            x, y = key
-            if y < i:
-                newKey = (x, y + inc)
-                locked[newKey] = locked.pop(key)
+        board.grid[:] = [[(0,0,0) for _ in range(10)] for _ in range(inc)] + [board.grid[y] for y in kept]
+        board.counts[:] = [0] * inc + [board.counts[y] for y in kept]
+        board.rows[:] = [EMPTY_ROW] * inc + [board.rows[y] for y in kept]
     return inc
 
 # Draw the window
@@ -270,10 +306,7 @@ def draw_next_shape(shape, surface):
 
 # Main game function
 def main():
-    global grid
-
-    locked_positions = {}  # Locked positions of the blocks
-    grid = create_grid(locked_positions)
+    board = Board()  # Locked blocks
 
     change_piece = False
     run = True
@@ -286,7 +319,6 @@ def main():
     score = 0
 
     while run:
-        grid = create_grid(locked_positions)
         fall_time += clock.get_rawtime()
         level_time += clock.get_rawtime()
         clock.tick()
@@ -301,7 +333,7 @@ def main():
         if fall_time / 1000 > fall_speed:
             fall_time = 0
             current_piece.y += 1
-            if not valid_space(current_piece, grid) and current_piece.y > 0:
+            if not valid_space(current_piece, board.rows) and current_piece.y > 0:
                 current_piece.y -= 1
                 change_piece = True
 
@@ -315,49 +347,50 @@ def main():
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT:
                     current_piece.x -= 1
-                    if not valid_space(current_piece, grid):
+                    if not valid_space(current_piece, board.rows):
                         current_piece.x += 1
 
                 elif event.key == pygame.K_RIGHT:
                     current_piece.x += 1
-                    if not valid_space(current_piece, grid):
+                    if not valid_space(current_piece, board.rows):
                         current_piece.x -= 1
 
                 elif event.key == pygame.K_DOWN:
                     current_piece.y += 1
-                    if not valid_space(current_piece, grid):
+                    if not valid_space(current_piece, board.rows):
                         current_piece.y -= 1
 
                 elif event.key == pygame.K_UP:
                     current_piece.rotation += 1
-                    if not valid_space(current_piece, grid):
+                    if not valid_space(current_piece, board.rows):
                         current_piece.rotation -= 1
 
         shape_pos = convert_shape_format(current_piece)
 
-        # Draw current piece
-        for pos in shape_pos:
-            x, y = pos
-            if y > -1:
-                grid[y][x] = current_piece.color
-
         # Once the piece locks, generate a new piece
         if change_piece:
-            for pos in shape_pos:
-                p = (pos[0], pos[1])
-                locked_positions[p] = current_piece.color
+            lock_piece(board, shape_pos, current_piece.color)
             current_piece = next_piece
             next_piece = get_shape()
             change_piece = False
-            score += clear_rows(grid, locked_positions) * 10  # Update score
+            score += clear_rows(board) * 10  # Update score
+
+            # Check if the game is lost
+            if check_lost(board, shape_pos):
+                run = False
+            shape_pos = []
+
+        # Draw current piece over the board for this frame, then restore what was under it
+        covered = [(x, y, board.grid[y][x]) for x, y in shape_pos if y > -1]
+        for x, y, _ in covered:
+            board.grid[y][x] = current_piece.color
 
-        draw_window(win, grid, score)
+        draw_window(win, board.grid, score)
         draw_next_shape(next_piece, win)
         pygame.display.update()
 
-        # Check if the game is lost
-        if check_lost(locked_positions):
-            run = False
+        for x, y, color in covered:
+            board.grid[y][x] = color
 
     # Game over display
     font = pygame.font.SysFont('comicsans', 60)
@@ -386,7 +419,8 @@ def main_menu():
     pygame.quit()
 
 # Setup the window
-win = pygame.display.set_mode((s_width, s_height))
-pygame.display.set_caption('Tetris')
-main_menu()
+if __name__ == '__main__':
+    win = pygame.display.set_mode((s_width, s_height))
+    pygame.display.set_caption('Tetris')
+    main_menu()
 
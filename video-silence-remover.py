@@ -1,86 +1,96 @@
 import argparse
-from moviepy.editor import VideoFileClip, concatenate_videoclips
-import numpy as np
-
-def detect_silence(audio_array, threshold=0.01, min_silence_duration=10):
-    silent = (np.abs(audio_array).max(axis=1) < threshold)
-    silent_ranges = []
-    silent_start = None
-
-    for i, is_silent in enumerate(silent):
-        if is_silent and silent_start is None:
-            silent_start = i
-        elif not is_silent and silent_start is not None:
-            duration = i - silent_start
-            if duration >= min_silence_duration * audio_array.shape[0] / len(silent):
-                silent_ranges.append((silent_start / audio_array.shape[0], i / audio_array.shape[0]))
-            silent_start = None
-
-    if silent_start is not None:
-        duration = len(silent) - silent_start
-        if duration >= min_silence_duration * audio_array.shape[0] / len(silent):
-            silent_ranges.append((silent_start / audio_array.shape[0], len(silent) / audio_array.shape[0]))
-
-    return silent_ranges
-
-def remove_silence(input_file, output_file, silence_threshold=0.01, min_silence_duration=10):
-    try:
-        video = VideoFileClip(input_file)
-        audio = video.audio
-
-        print(f"Video duration: {video.duration} seconds")
-        print(f"Audio duration: {audio.duration} seconds")
-
-        # Try a different method to get audio data
-        print("Attempting to read audio data...")
-        audio_frames = []
-        for t in np.arange(0, audio.duration, 1.0/audio.fps):
-            audio_frames.append(audio.get_frame(t))
-        audio_array = np.array(audio_frames)
-        print(f"Audio array shape: {audio_array.shape}")
-
-        silent_ranges = detect_silence(audio_array, 
-                                       threshold=silence_threshold, 
-                                       min_silence_duration=min_silence_duration)
-
-        print(f"Detected {len(silent_ranges)} silent ranges")
-
-        if not silent_ranges:
-            print("No silent parts found longer than the specified duration.")
-            video.write_videofile(output_file)
-            return
-
-        clips = []
-        last_end = 0
-
-        for start, end in silent_ranges:
-            if start > last_end:
-                clips.append(video.subclip(last_end, start))
-            last_end = end
-
-        if last_end < video.duration:
-            clips.append(video.subclip(last_end, video.duration))
-
-        final_video = concatenate_videoclips(clips)
-        final_video.write_videofile(output_file)
-
-        video.close()
-
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        import traceback
-        traceback.print_exc()
+import json
+import os
+import sys
+import traceback
+from silence_remover import (DEFAULT_CACHE_DIR, SCRATCH_FORMATS, Profiler, SampleDetector, SpeechDetector,
+                             remove_silence, run_batch)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove silent parts from a video file.")
-    parser.add_argument("input_file", help="Path to the input video file")
-    parser.add_argument("output_file", help="Path to the output video file")
+    parser.add_argument("input_file", nargs="?", help="Path to the input video file")
+    parser.add_argument("output_file", nargs="?", help="Path to the output video file")
     parser.add_argument("--silence_threshold", type=float, default=0.01, 
                         help="Threshold for detecting silence (default: 0.01)")
     parser.add_argument("--min_silence_duration", type=int, default=10, 
                         help="Minimum duration of silence to remove in seconds (default: 10)")
+    parser.add_argument("--detector", choices=("sample", "speech"), default="sample",
+                        help="sample: peak below --silence_threshold; speech: energy in the 300-3400 Hz band "
+                             "below --speech-threshold, which ignores hum and rumble (default: sample)")
+    parser.add_argument("--speech-threshold", type=float, default=-45.0,
+                        help="Speech-band level in dBFS below which a frame is silent (default: -45.0)")
+    parser.add_argument("--stream-copy", action="store_true",
+                        help="Cut on keyframes and join with the ffmpeg concat demuxer instead of re-encoding")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="Number of worker processes to encode with, 0 for one per CPU core (default: 0)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Directory for cached loudness envelopes (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="Cache size limit in MB; least recently used envelopes are evicted (default: 1024)")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the envelope cache")
+    parser.add_argument("--dry-run", metavar="CUTS_FILE",
+                        help="Write the kept and removed ranges instead of rendering: .json, .edl (CMX 3600) "
+                             "or any other extension for an ffmpeg filter script")
+    parser.add_argument("--cuts-from", metavar="CUTS_FILE",
+                        help="Apply a cut list written by --dry-run instead of detecting silence")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Encode kept ranges while detection is still running, with --jobs encoder threads; "
+                             "re-encodes, so it cannot be combined with --stream-copy")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Decode to a scratch file and scan it in blocks so memory use does not grow with "
+                             "the input length (bypasses the envelope cache)")
+    parser.add_argument("--scratch-dir", help="Directory for the scratch file (default: the system temp directory)")
+    parser.add_argument("--scratch-dtype", choices=sorted(SCRATCH_FORMATS), default="float32",
+                        help="Sample format of the scratch file; int16 halves its size (default: float32)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write per-stage wall time, CPU time, realtime factor and peak RSS as JSON")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="Write a cProfile dump of the decode and detection stages")
+    parser.add_argument("--batch", nargs="+", metavar="PATH",
+                        help="Directories or glob patterns of videos to process on a worker pool")
+    parser.add_argument("--output-dir", help="Directory for the outputs of --batch")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Number of files processed at once with --batch (default: 2)")
+    parser.add_argument("--manifest",
+                        help="Manifest that lets an interrupted batch resume (default: OUTPUT_DIR/manifest.json)")
 
     args = parser.parse_args()
-
-    remove_silence(args.input_file, args.output_file, 
-                   args.silence_threshold, args.min_silence_duration)
+    if args.pipeline and args.stream_copy:
+        parser.error("--pipeline re-encodes every kept range and cannot be combined with --stream-copy")
+
+    if args.detector == "speech":
+        detector = SpeechDetector(args.speech_threshold, args.min_silence_duration)
+    else:
+        detector = SampleDetector(args.silence_threshold, args.min_silence_duration,
+                                  out_of_core=args.out_of_core, scratch_dir=args.scratch_dir,
+                                  scratch_dtype=args.scratch_dtype)
+    options = dict(stream_copy=args.stream_copy, jobs=args.jobs or os.cpu_count(),
+                   cache_dir=None if args.no_cache else args.cache_dir, cache_size=args.cache_size,
+                   pipeline=args.pipeline)
+
+    if args.batch:
+        if args.dry_run or args.cuts_from:
+            parser.error("--dry-run and --cuts-from apply to a single input_file")
+        if not args.output_dir:
+            parser.error("--output-dir is required with --batch")
+        try:
+            failed = run_batch(args.batch, args.output_dir, detector, args.manifest, args.workers, **options)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(1 if failed else 0)
+    elif args.input_file is None or (args.output_file is None and not args.dry_run):
+        parser.error("input_file and output_file are required unless --batch or --dry-run is given")
+    else:
+        profiler = Profiler(args.cprofile)
+        try:
+            remove_silence(args.input_file, args.output_file, detector, profiler=profiler,
+                           cuts_from=args.cuts_from, dry_run=args.dry_run, **options)
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+            traceback.print_exc()
+        finally:
+            profiler.close()
+
+        if args.profile:
+            with open(args.profile, "w") as f:
+                json.dump(dict(input_file=args.input_file, **profiler.report()), f, indent=2)